@@ -5,44 +5,33 @@ Daedalus unified system
 
 """
 
+import time
+# reference for the startup time, see bench.py --startup
+START_TIME = time.monotonic()
+
 import os
+import re
 import sys
-
-# if not running on raspberry pi, stop here.
-def is_raspberry_pi():
-    try:
-        with open("/proc/device-tree/model", "r") as model_file:
-            if "Raspberry Pi" in model_file.read():
-                return True
-    except FileNotFoundError:
-        pass
-    return False
-
-if not is_raspberry_pi():
-    print("This code is designed for a Raspberry Pi.")
-    sys.exit(1)
-
-import json
-import toml
+import numpy as np
 import argparse
-import time
-import threading
-import requests
 from loguru import logger
-from influxdb_client import InfluxDBClient, WriteOptions
-import re
-import socket
-
-import RPi.GPIO as GPIO
-import spidev
-
-from voreas.tools import get_density_value
 
+from .hardware import check_backend, load_gpio, open_spi
 from .lakeshore import Lakeshore
-
-# REST shared variables
-shared_json1 = {}
-shared_json2 = {}
+from .maxigauge import Maxigauge
+from .scheduler import LatestValueStore, Scheduler, DeadlineTimer, CircuitBreaker
+from .influx_writer import InfluxWriter
+from .restapi import SnapshotStore, SSESubscriber
+from .adc import MCP3208, AdcSampler, AdcBank, AnalogChannel, decimate
+from .calibration import Calibration
+from .density import DensityEngine
+from .measurement import Point, LineProtocolEncoder
+from .metrics import Metrics, Profiler
+from .archive import ArchiveWriter
+from .config import load_config
+from .edges import EdgeMonitor
+from .burst import BurstCapture, EdgeTrigger, ThresholdTrigger
+from .deadband import DeadbandFilter
 
 # Validate the TOML file
 def validate_config(config):
@@ -53,8 +42,6 @@ def validate_config(config):
         "influx.org",
         "influx.bucket",
         "influx.token",
-        "restapi.resturl1",
-        "restapi.resturl2",
         "gas.species",
         "lakeshore.sensor1",
         "lakeshore.sensor2",
@@ -62,14 +49,7 @@ def validate_config(config):
         "lakeshore.port",
         "maxigauge.address",
         "maxigauge.port",
-        "nozzle_sensor.cal_points",
         "nozzle_sensor.pressure",        
-        "mcp3208_0.spi_bus",
-        "mcp3208_0.spi_cs",
-        "mcp3208_0.spi_max_speed_hz",
-        "mcp3208_0.num_average",
-        "pot_x.cal_points",
-        "pot_z.cal_points",        
     ]
     for key in required_keys:
         keys = key.split(".")
@@ -79,130 +59,220 @@ def validate_config(config):
                 raise ValueError(f"Missing required key: {key}")
             conf = conf[k]
 
-def validate_arguments(args):
-    if args.log and not args.logfile:
-        raise ValueError('Filename must be provided when logging is enabled')
-
-def flatten_dict(d, parent_key="", sep="_"):
-    items = []
-    for k, v in d.items():
-        if isinstance(v, dict):
-            items.extend(flatten_dict(v, "", sep=sep).items())
-        else:
-            items.append((k, v))
-    return dict(items)
-
-# Function to update the first shared variable
-def update_restapi1(url):
-    global shared_json1
-    s = requests.Session()
-    r = s.get(url, stream=True)
-    for line in r.iter_lines():
-        if line:
-            byte_array_str = line.decode("utf-8")
-            json_str = byte_array_str.replace("data: ", "")
-            shared_json1 = json.loads(json_str)
-
-# Function to update the second shared variable
-def update_restapi2(url):
-    global shared_json2
-    s = requests.Session()
-    r = s.get(url, stream=True)
-    for line in r.iter_lines():
-        if line:
-            byte_array_str = line.decode("utf-8")
-            json_str = byte_array_str.replace("data: ", "")
-            shared_json2 = json.loads(json_str)
-       
-def process_jsons(json1, json2):
-    name1 = "GJ_S4"
-    value1 = 0.1    
-    epoch_time1 = 1
-    
-    name2 = "GJ_E4"
-    value2 = 0.1  
-    epoch_time2 = 1
-
-    try:
-        name1 = json1['sourceInfo']['deviceName']
-        value1 = float(json1['data']['pressure']) / 100.0, # convert Pa to mbar
-        if isinstance(value1, tuple): # sometimes the value is tuple, why?
-            value1 = value1[0]
-        epoch_time1 = float(json1['data']['timestampAcq'] / 1e9)
-        
-        name2 = json2['sourceInfo']['deviceName']
-        value2 = float(json2['data']['pressure']) / 100.0, # convert Pa to mbar
-        if isinstance(value2, tuple): # sometimes the value is tuple, why?
-            value2 = value2[0]
-        epoch_time2 = float(json2['data']['timestampAcq'] / 1e9)
-                
-    except(KeyError):
-        pass # do nothing for now.
-
-    s4 = {
-        "name": "vacuum",
-        "dev": "GJ_S4", # Identifier for measurement device
-        "ldev": name1,  # Identifier for logging device
-        "value": value1,
-        "epoch_time": epoch_time1
-    }
-    e4 = {
-        "name": "vacuum",
-        "dev": "GJ_E4", # Identifier for measurement device
-        "ldev": name2,  # Identifier for logging device
-        "value": value2,
-        "epoch_time": epoch_time2
-    }
-
+    # any number of ADC chips, each in its own mcp3208_N section
+    chips = get_adc_chips(config)
+    if not chips:
+        raise ValueError("Missing required section: mcp3208_0")
+    for chip in chips:
+        for key in ("spi_bus", "spi_cs", "spi_max_speed_hz", "num_average"):
+            if key not in config[chip]:
+                raise ValueError(f"Missing required key: {chip}.{key}")
+    names = set()
+    for channel in get_analog_channels(config):
+        if channel.name in names:
+            raise ValueError(f"Analog channel {channel.name} is mapped twice")
+        if not 0 <= channel.channel < 8:
+            raise ValueError(f"Invalid input {channel.channel} for analog channel {channel.name}")
+        names.add(channel.name)
+
+    # REST feeds are either given as a table or by the two legacy URLs
+    restapi = config.get("restapi", {})
+    if "feeds" not in restapi and not ("resturl1" in restapi and "resturl2" in restapi):
+        raise ValueError("Missing required key: restapi.feeds (or restapi.resturl1 and restapi.resturl2)")
+
+    # burst triggers are edges of digital inputs or thresholds of analog channels
+    for name, spec in config.get("burst", {}).get("triggers", {}).items():
+        if "edge" in spec:
+            if spec["edge"] not in ("rising", "falling", "both"):
+                raise ValueError(f"Invalid edge {spec['edge']!r} for burst trigger {name}")
+        elif ("above" in spec) == ("below" in spec):
+            raise ValueError(f"Burst trigger {name} needs either edge, above or below")
+
+def get_restapi_feeds(config):
+    """Returns {key: (dev, url)} of all configured REST feeds."""
+    restapi = config["restapi"]
+    if "feeds" in restapi:
+        return {key: (feed["dev"], feed["url"]) for key, feed in restapi["feeds"].items()}
     return {
-        "s4": s4,
-        "e4": e4,
+        "s4": ("GJ_S4", restapi["resturl1"]),
+        "e4": ("GJ_E4", restapi["resturl2"]),
     }
 
-def update_epoch_time(data):
-    right_now = time.time()
-    if isinstance(data, dict):  # If it's a dictionary
-        for key, value in data.items():
-            if key == "epoch_time":
-                data[key] = right_now  # Update value
+# channels of mcp3208_0 without a channels table: input, calibration section and point
+LEGACY_ANALOG_CHANNELS = {
+    "xpos": (0, "pot_x", "position", {"ch": "x", "dev": "nozzle", "ldev": "daedalus"}),
+    "zpos": (1, "pot_z", "position", {"ch": "z", "dev": "nozzle", "ldev": "daedalus"}),
+    "nozzle_pressure": (2, "nozzle_sensor", "pressure", {"ch": "0", "dev": "nozzle", "ldev": "daedalus"}),
+}
+
+def get_adc_chips(config):
+    """Returns the names of all mcp3208_N sections ordered by N."""
+    chips = [key for key in config if re.fullmatch(r"mcp3208_\d+", key)]
+    return sorted(chips, key=lambda chip: int(chip.split("_")[1]))
+
+def get_analog_channels(config):
+    """Returns the AnalogChannel of every mapped ADC input.
+
+    Inputs are mapped in the channels table of a chip section. Without one,
+    mcp3208_0 has the nozzle positions on inputs 0 and 1 and the nozzle
+    pressure on input 2, calibrated by pot_x, pot_z and nozzle_sensor.
+    The calibration curves are compiled into lookup tables here."""
+    channels = []
+    for chip in get_adc_chips(config):
+        table = config[chip].get("channels")
+        if table is None:
+            if chip != "mcp3208_0":
+                continue
+            table = {name: {} for name in LEGACY_ANALOG_CHANNELS}
+        for name, spec in table.items():
+            if "channel" not in spec and name not in LEGACY_ANALOG_CHANNELS:
+                raise ValueError(f"Missing required key: {chip}.channels.{name}.channel")
+            channel, cal_section, measurement, static_tags = LEGACY_ANALOG_CHANNELS.get(
+                name, (None, None, name, {"ch": str(spec.get("channel")), "dev": chip, "ldev": "daedalus"}))
+            # the curve is given with the channel or in the legacy section
+            cal_spec = spec if "cal_points" in spec or "polynomial" in spec else config.get(cal_section)
+            if cal_spec is None:
+                raise ValueError(f"Missing required key: {chip}.channels.{name}.cal_points")
+            if name == "nozzle_pressure" and config["nozzle_sensor"]["pressure"] >= 0:
+                calibration = Calibration.constant(config["nozzle_sensor"]["pressure"])
             else:
-                update_epoch_time(value)  # Recurse into sub-elements
-    elif isinstance(data, list):  # If it's a list
-        for item in data:
-            update_epoch_time(item)  # Recurse into each list item
+                calibration = Calibration.from_config(cal_spec)
+            static_tags = dict(static_tags)
+            for tag in ("ch", "dev"):
+                if tag in spec:
+                    static_tags[tag] = str(spec[tag])
+            channels.append(AnalogChannel(
+                name=name,
+                chip=chip,
+                channel=spec.get("channel", channel),
+                calibration=calibration,
+                measurement=spec.get("measurement", measurement),
+                static_tags=static_tags,
+            ))
+    return channels
+
+def get_burst_triggers(config, input_names, analog_names):
+    """Returns the edge and the threshold triggers of the burst capture, unknown inputs are skipped."""
+    edge_triggers = []
+    threshold_triggers = []
+    for name, spec in config.get("burst", {}).get("triggers", {}).items():
+        if "edge" in spec and name in input_names:
+            edge_triggers.append(EdgeTrigger(name, spec["edge"]))
+        elif "edge" not in spec and name in analog_names:
+            threshold_triggers.append(ThresholdTrigger(name, above=spec.get("above"), below=spec.get("below")))
+        else:
+            logger.warning(f"Burst trigger {name} is neither a digital input nor an analog channel, ignoring it")
+    return edge_triggers, threshold_triggers
 
-    return data
+def validate_arguments(args):
+    if args.log and not args.logfile:
+        raise ValueError('Archive directory must be provided when logging is enabled')
+
+def create_points(feeds, analog_channels=()):
+    """Returns the reusable records of all channels, keyed like the entries of the JSON log."""
+    points = {
+        "s1": Point("vacuum", {"ch": 4, "dev": "GJ_S1", "ldev": "gj_maxigauge"}),
+        "s2": Point("vacuum", {"ch": 5, "dev": "GJ_S2", "ldev": "gj_maxigauge"}),
+        "s3": Point("vacuum", {"ch": 6, "dev": "GJ_S3", "ldev": "gj_maxigauge"}),
+        "e1": Point("vacuum", {"ch": 1, "dev": "GJ_E1", "ldev": "gj_maxigauge"}),
+        "e2": Point("vacuum", {"ch": 2, "dev": "GJ_E2", "ldev": "gj_maxigauge"}),
+        "e3": Point("vacuum", {"ch": 3, "dev": "GJ_E3", "ldev": "gj_maxigauge"}),
+        "temperature1": Point("temperature", {"dev": "GJ_ColdheadT1", "ldev": "lakeshore", "ch": 1}),
+        "temperature2": Point("temperature", {"dev": "GJ_ColdheadT2", "ldev": "lakeshore", "ch": 2}),
+        "xpos": Point("position", {"ch": "x", "dev": "nozzle", "ldev": "daedalus"}),
+        "zpos": Point("position", {"ch": "z", "dev": "nozzle", "ldev": "daedalus"}),
+        "nozzle_pressure": Point("pressure", {"ch": "0", "dev": "nozzle", "ldev": "daedalus"}),
+        "shutter_signal": Point("shutter", {"ch": "0", "dev": "nozzle", "ldev": "daedalus", "type": "signal"}),
+        "shutter_sensor": Point("shutter", {"ch": "0", "dev": "nozzle", "ldev": "daedalus", "type": "sensor"}),
+    }
+    for channel in analog_channels:
+        if channel.name not in points:
+            points[channel.name] = Point(channel.measurement, channel.static_tags)
+    for key, (dev, _) in feeds.items():
+        # Identifier for measurement device, the logging device comes with the data
+        points[key] = Point("vacuum", {"dev": dev})
+    points["density"] = Point("density", {"dev": "GJ"})
+    return points
+
+def record_columns(points, analog_channels, feeds):
+    """Returns the fields and tags every point can have, the layout of the multiprocess records."""
+    columns = {key: ({"value": "float", "stale": "bool"}, {}) for key in points}
+    for channel in analog_channels:
+        fields, tags = columns[channel.name]
+        fields.update(mean="float", min="float", max="float", std="float", count="int")
+        tags["raw"] = "int"
+    for key in ("xpos", "zpos"):
+        columns[key][1].update(limit_plus="bool", limit_minus="bool")
+    for key in ("shutter_signal", "shutter_sensor"):
+        columns[key][0]["value"] = "bool"
+    for key in feeds:
+        columns[key][1]["ldev"] = "str"
+    columns["density"][0]["species"] = "str"
+    return columns
+
+def create_edge_points(names):
+    """Returns one reusable record per digital input for its edge events."""
+    return {name: Point("gpio_event", {"ch": name, "dev": "nozzle", "ldev": "daedalus"}) for name in names}
+
+def get_feed_value(snapshot_store, key):
+    """Returns the latest value of a REST feed, 0.1 if nothing has been received yet."""
+    snapshot = snapshot_store.get(key)
+    return 0.1 if snapshot is None else snapshot.value
+
+def to_ns(epoch_time, default):
+    """Converts an epoch time in seconds to ns, default (already in ns) if there is none."""
+    return default if epoch_time is None else int(epoch_time * 1e9)
+
+def process_snapshots(snapshot_store, feeds, points, timestamp):
+    """Updates the vacuum point of every REST feed from the latest snapshots.
+
+    The points carry the acquisition time of the device, timestamp is used until data arrives."""
+    for key, (dev, _) in feeds.items():
+        snapshot = snapshot_store.get(key)
+        acq_time = timestamp if snapshot is None else to_ns(snapshot.acq_time, timestamp)
+        point = points[key].set(get_feed_value(snapshot_store, key), acq_time)
+        # Identifier for logging device
+        point.tags["ldev"] = dev if snapshot is None else snapshot.device_name
 
 def decode_mcp23s08_reg(reg_value):
     """Returns a list representing the state of 8 GPIO pins (True for HIGH, False for LOW)."""    
     state_vector = [(reg_value >> i) & 1 == 1 for i in range(8)]
     return state_vector
 
-def adc_to_voltage(adc_value, adc_range=4095, voltage_range=3.3):
-    """Convert ADC value to voltage."""
-    return (adc_value / adc_range) * voltage_range
-
-def voltage_to_pressure(voltage, cal_points):
-    """Convert voltage to pressure (mbar) using linear interpolation, clipped to 0-60 mbar."""
-    v1, v2 = cal_points[0]  # Voltage points
-    p1, p2 = cal_points[1]  # Corresponding pressure points
-
-    # Linear interpolation formula
-    pressure = p1 + (voltage - v1) * (p2 - p1) / (v2 - v1)
-
-    # Clipping the pressure value to be within [0, 60] range
-    return max(p1, min(pressure, p2))
+def supervision_setting(config, source, key, default=None):
+    """Setting of a source in the supervision section, else the section wide one or default."""
+    section = config.get("supervision", {})
+    return section.get(source, {}).get(key, section.get(key, default))
 
-def voltage_to_position(voltage, cal_points):
-    """Convert voltage to position (mm) using linear interpolation, clipped to the defined range."""
-    v1, v2 = cal_points[0]  # Voltage points
-    pos1, pos2 = cal_points[1]  # Corresponding position points
-
-    # Linear interpolation formula
-    position = pos1 + (voltage - v1) * (pos2 - pos1) / (v2 - v1)
+def breaker_settings(config, source):
+    return dict(
+        failures=supervision_setting(config, source, "failures", 3),
+        min_backoff=supervision_setting(config, source, "min_backoff", 1),
+        max_backoff=supervision_setting(config, source, "max_backoff", 60),
+    )
 
-    # Clipping the position value within the defined range
-    return position
+def is_stale(timestamp, now, limit):
+    """True if a source has delivered nothing within limit seconds, or nothing at all."""
+    return timestamp is None or now - timestamp > limit
+
+def mark_stale(point, stale):
+    """A field, as a tag it would start a new series whenever the source goes stale."""
+    point.fields["stale"] = stale
+
+def age(timestamp, now):
+    """Seconds since the given epoch time, None if there is no timestamp yet."""
+    return None if timestamp is None else now - timestamp
+
+def add_statistics(point, statistics, column):
+    """Adds the decimated statistics of one channel as extra fields to a point."""
+    if statistics is None:
+        for key in ("mean", "min", "max", "std", "count"):
+            point.fields.pop(key, None)
+        return point
+    for key in ("mean", "min", "max", "std"):
+        point.fields[key] = float(statistics[key][column])
+    point.fields["count"] = statistics["count"]
+    return point
 
 def toggle_led():
     """Toggle the LED state."""
@@ -210,80 +280,6 @@ def toggle_led():
     led_state = not led_state
     GPIO.output(LED_PIN, led_state)
 
-def read_adc_channel(spi, channel):
-    (msg_up, msg_dn) = (
-        (0x06, 0x00) if channel == 0
-        else (0x06, 0x40) if channel == 1
-        else (0x06, 0x80) if channel == 2
-        else (0x06, 0xC0) if channel == 3
-        else (0x07, 0x00) if channel == 4
-        else (0x07, 0x40) if channel == 5
-        else (0x07, 0x80) if channel == 6
-        else (0x07, 0xC0)
-    )
-
-    resp = spi.xfer([msg_up, msg_dn, 0x00])
-    value = (resp[1] << 8) + resp[2]
-    value = int(value)
-
-    # clip value
-    if value <= 0:
-        value = 0
-    elif value > 4095:
-        value = 4095
-
-    return value
-
-def read_all_adc_channels(spi, num_average):
-    
-    ch0, ch1, ch2, ch3, ch4, ch5, ch6, ch7 = 0, 0, 0, 0, 0, 0, 0, 0
-    # do many measurements and average
-    for i in range(num_average):
-        ch0 += read_adc_channel(spi, 0)
-        ch1 += read_adc_channel(spi, 1)
-        ch2 += read_adc_channel(spi, 2)
-        ch3 += read_adc_channel(spi, 3)
-        ch4 += read_adc_channel(spi, 4)
-        ch5 += read_adc_channel(spi, 5)
-        ch6 += read_adc_channel(spi, 6)
-        ch7 += read_adc_channel(spi, 7)
-    return [
-        int(ch0 / num_average),
-        int(ch1 / num_average),
-        int(ch2 / num_average),
-        int(ch3 / num_average),
-        int(ch4 / num_average),
-        int(ch5 / num_average),
-        int(ch6 / num_average),
-        int(ch7 / num_average),
-    ]
-
-def get_pressures(host, port, timeout=2):
-    e1, e2, e3, s3, s2, s1 = [0] * 6  # Initialize values
-
-    try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            # timeout is not needed, I keep it here.
-            #s.settimeout(timeout)
-            s.connect((host, port))
-
-            response = s.recv(1024).decode()  # This may raise ConnectionResetError
-
-            if not response:  # Ensure data is received
-                raise ValueError(f"No incoming data?")
-
-            lines = response.split("\r\n")
-
-            for line in lines:
-                lst = line.split(',')
-                if len(lst) == 12:
-                    e1, e2, e3, s3, s2, s1 = (lst[i] for i in range(1, len(lst), 2))
-
-    except (socket.timeout, socket.error, ValueError) as e:
-        logger.error(f"While reading pressures: {e}. Will try again.")
-
-    return tuple(map(float, (e1, e2, e3, s3, s2, s1)))
-
 # ---------- main function
          
 def main():
@@ -299,7 +295,8 @@ def main():
     
     parser.add_argument('--debug', action='store_true', help='Enable debugging mode')
     parser.add_argument('--log', action='store_true', help='Enable logging mode')
-    parser.add_argument('--logfile', type=str, help='Log file name')
+    parser.add_argument('--logfile', type=str, help='Archive directory for logging')
+    parser.add_argument('--simulate', action='store_true', help='Run against local device simulators instead of the real hardware')
 
     args = parser.parse_args()
 
@@ -312,28 +309,45 @@ def main():
     if args.debug:
         logger.info('Debugging mode is enabled')
     if args.log:
-        logger.info(f'Logging to file: {args.logfile}')
+        logger.info(f'Logging to archive: {args.logfile}')
 
 
-    # Read and validate the configuration from the TOML file
-    config_path = args.cfg
-    if not os.path.exists(config_path):
-        raise FileNotFoundError(f"TOML file not found: {config_path}")
+    # Read and validate the configuration from the TOML file, cached after the first start
+    config = load_config(args.cfg, validate_config)
 
-    config = toml.load(config_path)
-    validate_config(config)
+    hardware_backend = config.get('hardware', {}).get('backend', 'rpi')
+    simulators = []
+    if args.simulate:
+        logger.info('Simulation mode is enabled, all devices are simulated')
+        hardware_backend = 'sim'
+        from .simulators import start_simulators
+        simulators = start_simulators(config)
+
+    try:
+        check_backend(hardware_backend)
+    except (ValueError, RuntimeError) as e:
+        logger.error(f'{e} Aborting...')
+        sys.exit(1)
 
     uni_update_rate = config['uni']['update_rate']
+
+    # optional per-source poll periods, default to the publish rate
+    poll_periods = config.get('poll', {})
     
     influx_url=f'{config["influx"]["address"]}:{config["influx"]["port"]}'
     influx_token = config["influx"]["token"]
     influx_org = config["influx"]["org"]
     influx_bucket = config["influx"]["bucket"]
+    influx_batch_size = config["influx"].get("batch_size", 500)
+    influx_flush_interval = config["influx"].get("flush_interval", uni_update_rate)
+    influx_spool_dir = config["influx"].get("spool_dir", "")
+    influx_spool_max_mb = config["influx"].get("spool_max_mb", 100)
+    influx_write_precision = config["influx"].get("write_precision", "ms")
 
-    restapi_resturl1 = config["restapi"]["resturl1"]
-    restapi_resturl2 = config["restapi"]["resturl2"]
+    restapi_feeds = get_restapi_feeds(config)
     
     gas_species = config["gas"]["species"]
+    density_config = config.get("density", {})
 
     lakeshore_sensor1 = config["lakeshore"]["sensor1"]
     lakeshore_sensor2 = config["lakeshore"]["sensor2"]
@@ -344,37 +358,53 @@ def main():
     maxigauge_port = config["maxigauge"]["port"]
     
     
-    nozzle_sensor_cal_points = config['nozzle_sensor']['cal_points']
     nozzle_sensor_pressure = config['nozzle_sensor']['pressure']
     if nozzle_sensor_pressure < 0:
         logger.info('Sensor value will be used for nozzle pressure')
     else:
         logger.info(f'Fixed value {nozzle_sensor_pressure} will be used for nozzle pressure.')
 
-    mcp3208_0_spi_bus = config['mcp3208_0']['spi_bus']
-    mcp3208_0_spi_cs = config['mcp3208_0']['spi_cs']
-    mcp3208_0_spi_max_speed_hz = config['mcp3208_0']['spi_max_speed_hz']
-    mcp3208_0_num_average = config['mcp3208_0']['num_average']
+    adc_chips = get_adc_chips(config)
+    analog_channels = get_analog_channels(config)
 
-    pot_x_cal_points = config['pot_x']['cal_points']
-    pot_z_cal_points = config['pot_z']['cal_points']
+    multiprocess_config = config.get('multiprocess', {})
+    zmq_config = config.get('zmq', {})
+    http_config = config.get('http', {})
+    deadband_config = config.get('deadband', {})
+    aggregate_config = config.get('aggregate', {})
+    burst_config = config.get('burst', {})
+
+    gpio_edge_detect = config.get('gpio', {}).get('edge_detect', True)
+    gpio_bouncetime = config.get('gpio', {}).get('bouncetime', 5)
 
-    
-    # REST API
-    # Create and start the first thread
-    restapi_thread1 = threading.Thread(target=update_restapi1, kwargs={'url' : restapi_resturl1})
-    restapi_thread1.daemon = True  # Daemon thread will exit when the main program exits
-    restapi_thread1.start()
 
-    # Create and start the second thread
-    restapi_thread2 = threading.Thread(target=update_restapi2, kwargs={'url' : restapi_resturl2})
-    restapi_thread2.daemon = True  # Daemon thread will exit when the main program exits
-    restapi_thread2.start()
+    
+    # self instrumentation, written as its own measurement
+    metrics = Metrics()
+    metrics_interval = config.get('metrics', {}).get('interval', 10)
+    profiler_kind = config.get('metrics', {}).get('profiler', '')
+    if profiler_kind:
+        Profiler(profiler_kind).install()
+
+    # REST API, one SSE subscriber per feed
+    snapshot_store = SnapshotStore()
+    sse_subscribers = [SSESubscriber(key, url, snapshot_store) for key, (_, url) in restapi_feeds.items()]
+    for subscriber in sse_subscribers:
+        subscriber.start()
 
     # Setup GPIO
     PINS = [16, 18, 22, 32, 33, 37]
+    INPUT_NAMES = [
+        "motx_lim_ring_outside",
+        "motx_lim_ring_inside",
+        "motz_lim_downstream",
+        "motz_lim_upstream",
+        "shutter_signal",
+        "shutter_sensor",
+    ]
     LED_PIN = 31  # LED pin
 
+    GPIO = load_gpio(hardware_backend)
     GPIO.setwarnings(False)  # Suppress warnings
     GPIO.setmode(GPIO.BOARD)  # Use BOARD numbering
     for pin in PINS:
@@ -384,126 +414,374 @@ def main():
     # LED state variable
     led_state = False
 
-    # setup SPI
-    mcp3208_0_spi_obj = spidev.SpiDev()
-    mcp3208_0_spi_obj.open(mcp3208_0_spi_bus, mcp3208_0_spi_cs)
-    mcp3208_0_spi_obj.max_speed_hz = mcp3208_0_spi_max_speed_hz
+    # edges are captured by interrupts, polling only resyncs the state
+    edges = None
+    if gpio_edge_detect:
+        edges = EdgeMonitor(
+            GPIO,
+            zip(INPUT_NAMES, PINS),
+            bouncetime=gpio_bouncetime,
+            # sensor value has to be negated because sensor gives HI when shutter is out
+            inverted=[PINS[5]],
+            metrics=metrics,
+        )
+
+    # burst captures read their pre and post trigger samples from the sampler buffers
+    burst_enabled = burst_config.get('enabled', False)
+    burst_pre_trigger = burst_config.get('pre_trigger', 500) / 1000
+    burst_post_trigger = burst_config.get('post_trigger', 500) / 1000
+    buffer_seconds = uni_update_rate * 4
+    if burst_enabled:
+        buffer_seconds = max(buffer_seconds, 2 * (burst_pre_trigger + burst_post_trigger) + 2)
+
+    # setup SPI, every chip converts only its mapped inputs and is sampled
+    # at a high rate in its own thread, the publish stage gets statistics per period
+    adc_samplers = {}
+    for chip in adc_chips:
+        chip_config = config[chip]
+        chip_channels = [channel.channel for channel in analog_channels if channel.chip == chip]
+        if not chip_channels:
+            logger.warning(f"No channels mapped on {chip}, not reading it")
+            continue
+        adc = MCP3208(
+            open_spi(hardware_backend, chip_config['spi_bus'], chip_config['spi_cs'], chip_config['spi_max_speed_hz']),
+            max_speed_hz=chip_config['spi_max_speed_hz'],
+            num_average=chip_config['num_average'],
+            channels=chip_channels,
+            reduction=chip_config.get('reduction', 'mean'),
+            trim_fraction=chip_config.get('trim_fraction', 0.1),
+        )
+        sample_rate = chip_config.get('sample_rate', 5)
+        if sample_rate * adc.read_time() > 1:
+            logger.warning(f"{chip} cannot be sampled at {sample_rate} Hz, one sample of {len(chip_channels)} channels "
+                           f"x {adc.num_average} takes {adc.read_time() * 1000:.0f} ms at {adc.max_speed_hz} Hz, "
+                           f"at most {1 / adc.read_time():.1f} Hz")
+        adc_samplers[chip] = AdcSampler(
+            adc,
+            rate=sample_rate,
+            capacity=int(sample_rate * buffer_seconds) + 1,
+            metrics=metrics,
+            # the first chip keeps the stage name of the single chip setup
+            name="spi" if chip == "mcp3208_0" else f"spi_{chip}",
+        )
+    adc_bank = AdcBank(adc_samplers, analog_channels)
+    adc_bank.start()
 
     lakeshore = Lakeshore(host=lakeshore_address, port=lakeshore_port)
 
-    # initialize variables with zero for any case
-    t1_val, t2_val, e1_val, e2_val, e3_val, s1_val, s2_val, s3_val = [0] * 8
+    # Maxigauge records are streamed and parsed in the background
+    maxigauge = Maxigauge(host=maxigauge_address, port=maxigauge_port)
+    maxigauge.start()
+
+    analog_by_name = {channel.name: channel for channel in analog_channels}
+
+    def get_nozzle_pressure():
+        channel = analog_by_name.get("nozzle_pressure")
+        if channel is None:
+            return nozzle_sensor_pressure
+        return channel.calibration.convert(adc_bank.latest("nozzle_pressure"))
+
+    density_settings = dict(
+        t_range=density_config.get("t_range", (10, 300)),
+        t_steps=density_config.get("t_steps", 60),
+        p_range=density_config.get("p_range", (0, 60)),
+        p_steps=density_config.get("p_steps", 61),
+        s_tolerance=density_config.get("s_tolerance", 0.02),
+        cache_dir=density_config.get("cache_dir", ""),
+        min_rebuild_interval=density_config.get("min_rebuild_interval", 600),
+        max_cache_files=density_config.get("max_cache_files", 20),
+    )
+    influx_settings = dict(
+        url=influx_url,
+        token=influx_token,
+        org=influx_org,
+        bucket=influx_bucket,
+        batch_size=influx_batch_size,
+        flush_interval=influx_flush_interval,
+        spool_dir=influx_spool_dir,
+        spool_max_bytes=influx_spool_max_mb * 1024 * 1024,
+        write_precision=influx_write_precision,
+        debug=args.debug,
+    )
+    # only changed values go to InfluxDB, the other outputs get every cycle
+    deadband_settings = None
+    if deadband_config.get('enabled', False):
+        deadband_settings = dict(
+            heartbeat=deadband_config.get('heartbeat', 60),
+            absolute=deadband_config.get('abs', 0.0),
+            relative=deadband_config.get('rel', 0.0),
+            channels={k: v for k, v in deadband_config.items() if isinstance(v, dict)},
+        )
+    # rolling aggregates go to their own bucket
+    aggregate_settings = downsampled_settings = None
+    if aggregate_config.get('enabled', False):
+        aggregate_settings = dict(
+            windows=aggregate_config.get('windows', [10, 60, 600]),
+            measurement_prefix=aggregate_config.get('measurement_prefix', ''),
+        )
+        downsampled_settings = dict(
+            influx_settings,
+            bucket=aggregate_config.get('bucket', '') or f'{influx_bucket}_downsampled',
+            spool_dir=os.path.join(influx_spool_dir, 'downsampled') if influx_spool_dir else '',
+            name='influx_write_downsampled',
+        )
+    archive_settings = dict(
+        directory=args.logfile,
+        max_rows=config.get('archive', {}).get('max_rows', 3600),
+        rotate_seconds=config.get('archive', {}).get('rotate_seconds', 3600),
+        flush_seconds=config.get('archive', {}).get('flush_seconds', 60),
+    )
+    zmq_settings = None
+    if zmq_config.get('enabled', False):
+        zmq_settings = dict(address=zmq_config.get('address', 'tcp://*:5560'), hwm=zmq_config.get('hwm', 1000))
+    http_settings = None
+    if http_config.get('enabled', False):
+        http_settings = dict(host=http_config.get('host', '0.0.0.0'), port=http_config.get('port', 8080))
+
+    # one reusable record per channel
+    points = create_points(restapi_feeds, analog_channels)
+    encoder = LineProtocolEncoder(precision=influx_write_precision)
+    edge_points = create_edge_points(INPUT_NAMES)
+
+    # Every source is polled in its own thread and writes into the store,
+    # the main loop below only publishes whatever is current.
+    store = LatestValueStore()
+    scheduler = Scheduler(store, metrics)
+
+    def poll_lakeshore():
+        t1_val, t2_val = store.get("lakeshore", (0, 0))
+
+        # both sensors in one round trip
+        t1_val_tmp, t2_val_tmp = lakeshore.get_temperatures([lakeshore_sensor1, lakeshore_sensor2])
+        t1_val = t1_val_tmp if t1_val_tmp != 0 else t1_val
+        t2_val = t2_val_tmp if t2_val_tmp != 0 else t2_val
+
+        return t1_val, t2_val
+
+    def poll_gpio():
+        if edges is not None:
+            return edges.resync()
+
+        digital_input_vector = [bool(GPIO.input(pin)) for pin in PINS]
+
+        # sensor value has to be negated because sensor gives HI when shutter is out
+        digital_input_vector[5] = not digital_input_vector[5]
+        return digital_input_vector
+
+    def add_source(name, func):
+        # a poll may take up to its period, failing sources are skipped and probed with backoff
+        period = poll_periods.get(name, uni_update_rate)
+        scheduler.add(name, period, func,
+                      budget=supervision_setting(config, name, 'budget', period),
+                      breaker=CircuitBreaker(name, **breaker_settings(config, name), metrics=metrics))
+
+    add_source("lakeshore", poll_lakeshore)
+    add_source("gpio", poll_gpio)
+
+    # in the multiprocess mode the density is calculated by a worker
+    multiprocess = multiprocess_config.get('enabled', False)
+    if not multiprocess:
+        density_engine = DensityEngine(gas_species, **density_settings)
+
+        def poll_density():
+            t1_val, _ = store.get("lakeshore", (0, 0))
+            _, _, _, s3_val, s2_val, s1_val = maxigauge.get_pressures()
+            s4_val = get_feed_value(snapshot_store, "s4")
+
+            return density_engine.get_density(T = t1_val, p = get_nozzle_pressure(), S1 = s1_val, S2 = s2_val, S3 = s3_val, S4 = s4_val)
+
+        add_source("density", poll_density)
+    scheduler.start()
+
+    publisher = live_server = archive = deadband = aggregator = downsampled_writer = None
+    supervisor = records = edge_records = densities = None
+    if multiprocess:
+        # the acquisition only fills shared memory rings, the outputs run in worker processes
+        from .shmring import Ring, RecordLayout
+        from .workers import (Supervisor, LineQueue, density_worker, influx_worker, archive_worker, live_worker,
+                              EDGE_FIELDS, DENSITY_FIELDS, INFLUX, ARCHIVE)
+        record_layout = RecordLayout(points, record_columns(points, analog_channels, restapi_feeds))
+        ring_size = multiprocess_config.get('ring_size', 3600)
+        records = Ring(record_layout.fields, ring_size)
+        record_row = records.row()
+        edge_records = Ring(EDGE_FIELDS, ring_size)
+        edge_row = edge_records.row()
+        densities = Ring(DENSITY_FIELDS, 16)
+        edge_point_list = [edge_points[name] for name in INPUT_NAMES]
+
+        supervisor = Supervisor(restart_delay=multiprocess_config.get('restart_delay', 1), metrics=metrics)
+        # metrics and other line protocol go to the InfluxDB worker through a queue
+        influx_writer = LineQueue(supervisor.queue())
+        supervisor.add("density", density_worker, records=records, densities=densities, layout=record_layout,
+                       species=gas_species, settings=density_settings, breaker=breaker_settings(config, "density"),
+                       fixed_pressure=None if "nozzle_pressure" in analog_by_name else nozzle_sensor_pressure)
+        supervisor.add("influx", influx_worker, records=records, edges=edge_records, layout=record_layout,
+                       edge_points=edge_point_list, lines=influx_writer.lines, settings=influx_settings,
+                       precision=influx_write_precision, deadband=deadband_settings,
+                       aggregate=aggregate_settings, downsampled=downsampled_settings,
+                       metrics_interval=metrics_interval)
+        if args.log:
+            supervisor.add("archive", archive_worker, records=records, layout=record_layout, settings=archive_settings)
+        if zmq_settings is not None or http_settings is not None:
+            supervisor.add("live", live_worker, records=records, edges=edge_records, layout=record_layout,
+                           edge_names=INPUT_NAMES, edge_points=edge_point_list, zmq=zmq_settings, http=http_settings)
+        supervisor.start()
+        logger.info(f"Multiprocess mode, workers: {', '.join(supervisor.workers)}")
+    else:
+        influx_writer = InfluxWriter(**influx_settings, metrics=metrics)
+
+        # live fan-out for local consumers
+        if zmq_settings is not None:
+            from .pubsub import Publisher
+            publisher = Publisher(**zmq_settings)
+
+        # latest values and SSE stream over HTTP
+        if http_settings is not None:
+            from .httpserver import LiveServer
+            live_server = LiveServer(**http_settings).start()
+
+        if deadband_settings is not None:
+            deadband = DeadbandFilter(**deadband_settings, metrics=metrics)
+
+        if aggregate_settings is not None:
+            from .aggregate import Aggregator
+            aggregator = Aggregator(**aggregate_settings)
+            downsampled_writer = InfluxWriter(**downsampled_settings, metrics=metrics)
+
+        if args.log:
+            archive = ArchiveWriter(**archive_settings)
+
+    burst = None
+    if burst_enabled:
+        edge_triggers, threshold_triggers = get_burst_triggers(config, INPUT_NAMES, analog_by_name)
+        if edge_triggers and edges is None:
+            logger.warning("Burst triggers on digital inputs need gpio.edge_detect")
+        burst_channels = burst_config.get('channels', []) or list(analog_by_name)
+        vacuum_keys = ("e1", "e2", "e3", "s3", "s2", "s1")
+
+        def write_burst(lines):
+            # a burst is written right away as one batch
+            influx_writer.write(lines)
+            influx_writer.flush()
+
+        burst = BurstCapture(
+            adc_bank,
+            [analog_by_name[name] for name in burst_channels if name in analog_by_name],
+            write_burst,
+            LineProtocolEncoder(precision=influx_write_precision),
+            edge_triggers=edge_triggers if edges is not None else (),
+            threshold_triggers=threshold_triggers,
+            pre_trigger=burst_pre_trigger,
+            post_trigger=burst_post_trigger,
+            holdoff=burst_config['holdoff'] / 1000 if 'holdoff' in burst_config else None,
+            vacuum=lambda: [(t, dict(zip(vacuum_keys, values))) for t, values in list(maxigauge.samples)],
+            vacuum_points={key: points[key] for key in vacuum_keys},
+            measurement_prefix=burst_config.get('measurement_prefix', 'burst_'),
+            metrics=metrics,
+        ).start()
+
+    if edges is not None:
+        edge_encoder = LineProtocolEncoder(precision=influx_write_precision)
+
+        def publish_edge(event):
+            # the publish loop sees the new state right away, the event itself is sent immediately
+            store.update("gpio", edges.state(), event.time / 1e9)
+            if edge_records is not None:
+                edge_row["time"] = event.time
+                edge_row["input"] = INPUT_NAMES.index(event.name)
+                edge_row["level"] = event.level
+                edge_records.append(edge_row)
+                return
+            edge_point = edge_points[event.name].set(event.level, event.time)
+            if publisher is not None:
+                publisher.publish([edge_point])
+            if live_server is not None:
+                live_server.event(event.name, edge_point)
+            influx_writer.write(edge_encoder.encode([edge_point]))
+            influx_writer.flush()
+
+        edges.subscribe(publish_edge)
+        if burst is not None:
+            edges.subscribe(burst.edge)
+        edges.start()
+
+    def update_health_gauges(now):
+        metrics.set_gauge("lakeshore", "reconnects", lakeshore.reconnects)
+        metrics.set_gauge("lakeshore", "staleness", age(store.timestamp("lakeshore"), now))
+        metrics.set_gauge("gpio", "staleness", age(store.timestamp("gpio"), now))
+        metrics.set_gauge("density", "staleness", age(store.timestamp("density"), now))
+        metrics.set_gauge("maxigauge", "reconnects", maxigauge.reconnects)
+        latest_pressures = maxigauge.latest()
+        metrics.set_gauge("maxigauge", "staleness", age(latest_pressures and latest_pressures[0], now))
+        for sampler in adc_samplers.values():
+            metrics.set_gauge(sampler.name, "staleness", age(sampler.latest_time(), now))
+            metrics.set_gauge(sampler.name, "overruns", sampler.overruns)
+        for subscriber in sse_subscribers:
+            metrics.set_gauge(f"restapi_{subscriber.key}", "reconnects", subscriber.reconnects)
+            metrics.set_gauge(f"restapi_{subscriber.key}", "staleness", snapshot_store.age(subscriber.key, now))
+        if influx_writer.spool is not None:
+            metrics.set_gauge("influx_write", "spool_bytes", influx_writer.spool.size())
+        if publisher is not None:
+            metrics.set_gauge("zmq", "dropped", publisher.dropped)
+        for source in scheduler.sources:
+            metrics.set_gauge(source.name, "breaker_open", source.breaker.open)
+        if supervisor is not None:
+            for name in supervisor.workers:
+                metrics.set_gauge(f"worker_{name}", "alive", supervisor.alive(name))
+            # records not yet committed by the workers that must not miss any
+            for name, reader in (("influx", INFLUX), ("archive", ARCHIVE)):
+                if name in supervisor.workers:
+                    metrics.set_gauge(f"worker_{name}", "lag", records.count() - records.cursor(reader))
+            metrics.set_gauge("worker_influx", "dropped_lines", influx_writer.dropped)
+
+    next_metrics_time = time.monotonic() + metrics_interval
+
+    # source of every point, its values are flagged stale after stale_after seconds without an update
+    point_sources = {key: "maxigauge" for key in ("e1", "e2", "e3", "s1", "s2", "s3")}
+    point_sources.update(temperature1="lakeshore", temperature2="lakeshore",
+                         shutter_signal="gpio", shutter_sensor="gpio", density="density")
+    point_sources.update({channel.name: channel.chip for channel in analog_channels})
+    point_sources.update({key: key for key in restapi_feeds})
+    stale_limits = {
+        source: supervision_setting(config, source, 'stale_after',
+                                    3 * max(poll_periods.get(source, uni_update_rate), uni_update_rate))
+        for source in set(point_sources.values())
+    }
+
+    # fixed publish period, independent of the time spent in the loop
+    deadline = DeadlineTimer(uni_update_rate, metrics)
+    first_cycle = True
 
-    # initial value for density
-    density = 0
-    
-    influx_write_options = WriteOptions(max_retries=1)
-    
     while True:
         try:
-            # TCU Jsons
-            
-            try:
-                t1_val_tmp = lakeshore.get_temperature(message=lakeshore_sensor1)
-                t1_val = t1_val_tmp if t1_val_tmp != 0 else t1_val
+            right_now = time.time_ns()
+            cycle_start = time.perf_counter()
+
+            # TCU
+
+            # every reading carries the time it was acquired at
+            t1_val, t2_val = store.get("lakeshore", (0, 0))
+            lakeshore_time = to_ns(store.timestamp("lakeshore"), right_now)
+            with metrics.timer("maxigauge"):
+                maxigauge_sample_time, maxigauge_values = maxigauge.latest() or (None, (0,) * 6)
+            e1_val, e2_val, e3_val, s3_val, s2_val, s1_val = maxigauge_values
+            maxigauge_time = to_ns(maxigauge_sample_time, right_now)
+
+            points["e1"].set(e1_val, maxigauge_time)
+            points["e2"].set(e2_val, maxigauge_time)
+            points["e3"].set(e3_val, maxigauge_time)
+            points["s1"].set(s1_val, maxigauge_time)
+            points["s2"].set(s2_val, maxigauge_time)
+            points["s3"].set(s3_val, maxigauge_time)
+            points["temperature1"].set(t1_val, lakeshore_time)
+            points["temperature2"].set(t2_val, lakeshore_time)
+
+            # MCU
+
+            # Latest digital inputs
+            digital_input_vector = store.get("gpio", [False] * len(PINS))
+            gpio_time = to_ns(store.timestamp("gpio"), right_now)
 
-                t2_val_tmp = lakeshore.get_temperature(message=lakeshore_sensor2)
-                t2_val = t2_val_tmp if t2_val_tmp != 0 else t2_val
-
-            except:
-                pass
-            
-            try:
-                e1_val, e2_val, e3_val, s3_val, s2_val, s1_val = get_pressures(maxigauge_address, maxigauge_port)
-            except ConnectionResetError as e:
-                logger.error(f"{e}. Ignoring...")        
-            
-            e1 = {
-                "name": "vacuum",
-                "ch": 1,
-                "dev": "GJ_E1",
-                "ldev": "gj_maxigauge",
-                "value": e1_val,
-                "epoch_time": 0,
-            }
-            e2 = {
-                "name": "vacuum",
-                "ch": 2,
-                "dev": "GJ_E2",
-                "ldev": "gj_maxigauge",
-                "value": e2_val,
-                "epoch_time": 0,
-            }
-            e3 = {
-                "name": "vacuum",
-                "ch": 3,
-                "dev": "GJ_E3",
-                "ldev": "gj_maxigauge",
-                "value": e3_val,
-                "epoch_time": 0,
-            }
-            s1 = {
-                "name": "vacuum",
-                "ch": 4,
-                "dev": "GJ_S1",
-                "ldev": "gj_maxigauge",
-                "value": s1_val,
-                "epoch_time": 0,
-            }
-            s2 = {
-                "name": "vacuum",
-                "ch": 5,
-                "dev": "GJ_S2",
-                "ldev": "gj_maxigauge",
-                "value": s2_val,
-                "epoch_time": 0,
-            }
-            s3 = {
-                "name": "vacuum",
-                "ch": 6,
-                "dev": "GJ_S3",
-                "ldev": "gj_maxigauge",
-                "value": s3_val,
-                "epoch_time": 0,
-            }
-
-            temperature1 = {
-                "name": "temperature",
-                "dev": "GJ_ColdheadT1",
-                "ldev": "lakeshore",
-                "ch": 1,
-                "value": t1_val,
-                "epoch_time": 0,
-            }
-
-            temperature2 = {
-                "name": "temperature",
-                "dev": "GJ_ColdheadT2",
-                "ldev": "lakeshore",
-                "ch": 2,
-                "value": t2_val,
-                "epoch_time": 0,
-            }
-
-            data_tcu = {
-                "s1": s1,
-                "s2": s2,
-                "s3": s3,
-                "e1": e1,
-                "e2": e2,
-                "e3": e3,
-                "temperature1": temperature1,
-                "temperature2": temperature2,
-            }
-            
-            # MCU JSONs
-
-            # Read out digital inputs            
-            digital_input_vector = [bool(GPIO.input(pin)) for pin in PINS]
-            
-            # sensor value has to be negated because sensor gives HI when shutter is out
-            digital_input_vector[5] = not digital_input_vector[5]
-            
             (
                 motx_lim_ring_outside,
                 motx_lim_ring_inside,
@@ -516,158 +794,118 @@ def main():
             led_state = not led_state
             GPIO.output(LED_PIN, led_state)
             
-            # Read out analog inputs            
-            analog_input_vector = read_all_adc_channels(mcp3208_0_spi_obj, mcp3208_0_num_average)
-            (
-                potx_raw,
-                potz_raw,
-                nozzle_pressure_raw
-            ) = analog_input_vector[0:3]
-            
-            if nozzle_sensor_pressure < 0:
-                nozzle_pressure_value = voltage_to_pressure(adc_to_voltage(nozzle_pressure_raw), nozzle_sensor_cal_points)
-            else:
-                nozzle_pressure_value = nozzle_sensor_pressure
-
-            potx_value = voltage_to_position(adc_to_voltage(potx_raw), pot_x_cal_points)
-            potz_value = voltage_to_position(adc_to_voltage(potz_raw), pot_z_cal_points)
-
-            if motx_lim_ring_outside or motx_lim_ring_inside:            
-                xpos = {
-                    "name": "position",
-                    "ch": "x",
-                    "dev": "nozzle",
-                    "ldev": "daedalus",
-                    "limit_plus" : motx_lim_ring_outside,
-                    "limit_minus" : motx_lim_ring_inside,
-                    "raw": potx_raw,
-                    "value": potx_value,
-                    "epoch_time": 0,
-                }
-            else:
-                xpos = {
-                    "name": "position",
-                    "ch": "x",
-                    "dev": "nozzle",
-                    "ldev": "daedalus",
-                    "raw": potx_raw,
-                    "value": potx_value,
-                    "epoch_time": 0,
-                }
-
-            if motz_lim_downstream or motz_lim_upstream:            
-                zpos = {
-                "name": "position",
-                "ch": "z",
-                "dev": "nozzle",
-                "ldev": "daedalus",
-                "limit_plus" : motz_lim_downstream,
-                "limit_minus" : motz_lim_upstream,
-                "raw": potz_raw,
-                "value": potz_value,
-                "epoch_time": 0,
-                }
-            else:
-                zpos = {
-                "name": "position",
-                "ch": "z",
-                "dev": "nozzle",
-                "ldev": "daedalus",
-                "raw": potz_raw,
-                "value": potz_value,
-                "epoch_time": 0,
-                }
-                
-            nozzle_pressure = {
-                "name": "pressure",
-                "ch": "0",
-                "dev": "nozzle",
-                "ldev": "daedalus",
-                "raw": nozzle_pressure_raw,
-                "value": nozzle_pressure_value,
-                "epoch_time": 0,
-            }
-
-            shutter_signal = {
-                "name": "shutter",
-                "ch": "0",
-                "dev": "nozzle",
-                "ldev": "daedalus",
-                "type": "signal",
-                "value": shutter_signal_value,
-                "epoch_time": 0,
-            }
-
-            shutter_sensor = {
-                "name": "shutter",
-                "ch": "0",
-                "dev": "nozzle",
-                "ldev": "daedalus",
-                "type": "sensor",
-                "value": shutter_sensor_value,
-                "epoch_time": 0,
+            # Latest analog inputs with the statistics over all samples of the last publish period
+            for chip, (_, sample_codes) in adc_bank.take().items():
+                chip_channels = [channel for channel in analog_channels if channel.chip == chip]
+                period_statistics = decimate(np.column_stack([
+                    channel.calibration.convert(sample_codes[:, column]) for column, channel in enumerate(chip_channels)
+                ]))
+                adc_time = to_ns(adc_samplers[chip].latest_time(), right_now)
+                for column, channel in enumerate(chip_channels):
+                    raw = adc_bank.latest(channel.name)
+                    point = points[channel.name].set(channel.calibration.convert(raw), adc_time)
+                    point.tags.clear()
+                    point.tags["raw"] = raw
+                    add_statistics(point, period_statistics, column)
+
+            # limit flags are only written while a limit is reached
+            xpos = points["xpos"]
+            if motx_lim_ring_outside or motx_lim_ring_inside:
+                xpos.tags["limit_plus"] = motx_lim_ring_outside
+                xpos.tags["limit_minus"] = motx_lim_ring_inside
+
+            zpos = points["zpos"]
+            if motz_lim_downstream or motz_lim_upstream:
+                zpos.tags["limit_plus"] = motz_lim_downstream
+                zpos.tags["limit_minus"] = motz_lim_upstream
+
+            points["shutter_signal"].set(shutter_signal_value, gpio_time)
+            points["shutter_sensor"].set(shutter_sensor_value, gpio_time)
+
+            # GRF
+
+            process_snapshots(snapshot_store, restapi_feeds, points, right_now)
+
+            # latest density, the calculation itself runs in its own thread or process
+            if densities is not None:
+                latest_density = densities.latest()
+                if latest_density is not None:
+                    store.update("density", float(latest_density["value"]), latest_density["time"] / 1e9)
+            density = points["density"].set(store.get("density", 0), to_ns(store.timestamp("density"), right_now))
+            density.fields["species"] = gas_species
+
+            # repeated last values are flagged until their source delivers again
+            source_times = {
+                "lakeshore": store.timestamp("lakeshore"),
+                "maxigauge": maxigauge_sample_time,
+                "gpio": store.timestamp("gpio"),
+                "density": store.timestamp("density"),
             }
-
-            data_mcu = {
-                "xpos": xpos,
-                "zpos": zpos,
-                "nozzle_pressure": nozzle_pressure,
-                "shutter_signal": shutter_signal,
-                "shutter_sensor": shutter_sensor,
-            }
-
-            # GRF JSONS
-
-            json_from_rest = process_jsons(shared_json1, shared_json2)
-            combined_json = data_tcu | data_mcu | json_from_rest
-
-            s4_val = combined_json.get("s4")["value"]
-
-            # calculate density
-            try:
-                density = get_density_value(name = gas_species, T = t1_val, p = nozzle_pressure_value, S1 = s1_val, S2 = s2_val, S3 = s3_val, S4 = s4_val)
-            except:
-                logger.error("\nSome issues encountered during density calculation. Ignoring...")
-
-
-            calculated_json = {
-                "density": {
-                    "name": "density",
-                    "dev":"GJ",
-                    "value": f'{density},species="{gas_species}"',
-                    "epoch_time": 0,
-                },
-            }
-
-            final_json = combined_json | calculated_json
-            
-            final_json = update_epoch_time(final_json)
-                       
-            string_list = []
-            
-            for key, value in final_json.items():
-                flat_dict = flatten_dict(value)
-                flat_string = ",".join([f"{k}={v}" for k, v in flat_dict.items()])
-                flat_string = flat_string.replace("name=", "").replace(",value", " value").replace(",epoch_time=", " ")
-                flat_string = flat_string[:flat_string.rfind(".")]
-                string_list.append(flat_string)
-
-            single_string = "\n".join(string_list)                
-            with InfluxDBClient(url=influx_url, token=influx_token, debug=args.debug) as client:
-                with client.write_api(write_options = influx_write_options) as writer:
-                    writer.write(bucket=influx_bucket, org=influx_org, record=single_string, write_precision="s")
+            for chip, sampler in adc_samplers.items():
+                source_times[chip] = sampler.latest_time()
+            for key in restapi_feeds:
+                snapshot = snapshot_store.get(key)
+                source_times[key] = None if snapshot is None else snapshot.received_time
+            for key, source in point_sources.items():
+                mark_stale(points[key], is_stale(source_times.get(source), right_now / 1e9, stale_limits[source]))
+
+            if records is not None:
+                # serialization and all outputs are done by the workers
+                records.append(record_layout.pack(record_row, right_now, points))
+            else:
+                with metrics.timer("serialization"):
+                    record = encoder.encode(points.values() if deadband is None else deadband.filter(points.items()))
+                influx_writer.write(record)
+                if aggregator is not None:
+                    downsampled_writer.write(encoder.encode(aggregator.add(right_now, points.items())))
+            if first_cycle:
+                logger.info(f"First cycle published {time.monotonic() - START_TIME:.3f} s after start")
+                first_cycle = False
+            if publisher is not None:
+                publisher.publish(points.values())
+            if live_server is not None:
+                live_server.update(points.items())
+            metrics.observe("publish", time.perf_counter() - cycle_start)
+
+            if time.monotonic() >= next_metrics_time:
+                next_metrics_time += metrics_interval
+                update_health_gauges(time.time())
+                influx_writer.write(encoder.encode(metrics.points(right_now)))
                             
-            if args.log:
-                with open(f'{args.logfile}', 'a') as f:
-                    f.write(json.dumps(final_json) + "\n")
+            if archive is not None:
+                archive.append(right_now, points.items())
                         
-            time.sleep(uni_update_rate)
+            deadline.wait()
             
         except (EOFError, KeyboardInterrupt):
             logger.success("\nUser input cancelled. Aborting...")
+            scheduler.stop()
+            if edges is not None:
+                edges.stop()
+            adc_bank.stop()
+            for subscriber in sse_subscribers:
+                subscriber.stop()
+            maxigauge.stop()
+            if burst is not None:
+                burst.stop()
+            influx_writer.close()
+            if downsampled_writer is not None:
+                downsampled_writer.close()
+            if supervisor is not None:
+                supervisor.stop()
+                for ring in (records, edge_records, densities):
+                    ring.close()
+            if publisher is not None:
+                publisher.close()
+            if live_server is not None:
+                live_server.stop()
+            if archive is not None:
+                archive.close()
             GPIO.cleanup()
-            mcp3208_0_spi_obj.close()
+            adc_bank.close()
             lakeshore.close()
+            for simulator in simulators:
+                simulator.stop()
             break
 
 
@@ -0,0 +1,331 @@
+"""
+Daedalus project MCP3208 ADC engine
+
+The command frames for all channels and all averages are built once. They
+are sent as one SPI message per chunk of up to 511 conversions, with the
+chip select toggled between conversions, as the MCP3208 needs. The reply
+is decoded and reduced with NumPy. Only the mapped channels are
+converted. Every chip is sampled in its own thread, chips on different
+buses are read concurrently.
+
+2025 xaratustrah@github
+
+"""
+
+import contextlib
+import fcntl
+import threading
+import time
+from collections import namedtuple
+import numpy as np
+from loguru import logger
+
+NUM_CHANNELS = 8
+ADC_MAX = 4095
+
+# struct spi_ioc_transfer from linux/spi/spidev.h
+SPI_IOC_TRANSFER = np.dtype([
+    ("tx_buf", "<u8"),
+    ("rx_buf", "<u8"),
+    ("len", "<u4"),
+    ("speed_hz", "<u4"),
+    ("delay_usecs", "<u2"),
+    ("bits_per_word", "u1"),
+    ("cs_change", "u1"),
+    ("tx_nbits", "u1"),
+    ("rx_nbits", "u1"),
+    ("word_delay_usecs", "u1"),
+    ("pad", "u1"),
+])
+
+# one named input, channel is the MCP3208 input 0..7
+AnalogChannel = namedtuple("AnalogChannel", ["name", "chip", "channel", "calibration", "measurement", "static_tags"])
+
+# SPI clocks per conversion, 3 bytes
+CLOCKS_PER_CONVERSION = 24
+
+# the size field of the ioctl request has 14 bits
+MAX_TRANSFERS_PER_MESSAGE = (1 << 14) // SPI_IOC_TRANSFER.itemsize - 1
+
+
+def spi_ioc_message(n):
+    """Same as the SPI_IOC_MESSAGE(n) macro."""
+    return (1 << 30) | ((n * SPI_IOC_TRANSFER.itemsize) << 16) | (ord("k") << 8)
+
+
+def command_frame(channels, num_average):
+    """Returns the uint8 commands of shape (num_average, len(channels), 3) for single ended conversions."""
+    channels = np.asarray(channels, dtype=np.uint8)
+    frame = np.zeros((num_average, len(channels), 3), dtype=np.uint8)
+    frame[:, :, 0] = 0x06 | (channels >> 2)
+    frame[:, :, 1] = (channels & 0x03) << 6
+    return frame
+
+
+def decode_frame(rx):
+    """Returns the 12 bit codes from the reply bytes, shape (num_average, num_channels)."""
+    codes = ((rx[..., 1].astype(np.int32) & 0x0F) << 8) | rx[..., 2]
+    return np.clip(codes, 0, ADC_MAX)
+
+
+def trimmed_mean(samples, fraction=0.1, axis=0):
+    """Mean after cutting off the given fraction of the lowest and the highest samples."""
+    n = samples.shape[axis]
+    cut = int(n * fraction)
+    if cut == 0 or 2 * cut >= n:
+        return samples.mean(axis=axis)
+    ordered = np.sort(samples, axis=axis)
+    return np.take(ordered, range(cut, n - cut), axis=axis).mean(axis=axis)
+
+
+REDUCTIONS = {
+    "mean": lambda samples, trim: samples.mean(axis=0),
+    "median": lambda samples, trim: np.median(samples, axis=0),
+    "trimmed_mean": lambda samples, trim: trimmed_mean(samples, trim, axis=0),
+}
+
+
+class MCP3208:
+    def __init__(self, spi, max_speed_hz, num_average=8, channels=range(NUM_CHANNELS),
+                 reduction="mean", trim_fraction=0.1):
+        """spi is an opened spidev.SpiDev or a simulated one, see hardware.open_spi()."""
+        if reduction not in REDUCTIONS:
+            raise ValueError(f"Unknown reduction {reduction}, choose from {', '.join(REDUCTIONS)}")
+        self.channels = list(channels)
+        self.num_average = num_average
+        self.max_speed_hz = max_speed_hz
+        self.reduction = reduction
+        self.trim_fraction = trim_fraction
+
+        self.spi = spi
+        self._prepare()
+
+    def _prepare(self):
+        """Builds the command frame, the reply buffer and the transfer descriptors once."""
+        self._tx = command_frame(self.channels, self.num_average)
+        self._rx = np.zeros_like(self._tx)
+        num = self._tx.shape[0] * self._tx.shape[1]
+
+        transfers = np.zeros(num, dtype=SPI_IOC_TRANSFER)
+        transfers["tx_buf"] = self._tx.ctypes.data + 3 * np.arange(num, dtype=np.uint64)
+        transfers["rx_buf"] = self._rx.ctypes.data + 3 * np.arange(num, dtype=np.uint64)
+        transfers["len"] = 3
+        transfers["speed_hz"] = self.max_speed_hz
+        transfers["bits_per_word"] = 8
+        # release chip select after each conversion
+        transfers["cs_change"] = 1
+
+        self._messages = []
+        for start in range(0, num, MAX_TRANSFERS_PER_MESSAGE):
+            chunk = transfers[start:start + MAX_TRANSFERS_PER_MESSAGE].copy()
+            # for the last transfer cs_change would keep the chip selected
+            chunk["cs_change"][-1] = 0
+            self._messages.append((spi_ioc_message(len(chunk)), chunk))
+
+    def _transfer(self):
+        try:
+            fd = self.spi.fileno()
+        except AttributeError:
+            fd = None
+        if fd is not None:
+            for request, chunk in self._messages:
+                fcntl.ioctl(fd, request, chunk)
+            return
+
+        # older spidev without fileno() or simulated SPI, one transfer per conversion
+        tx = self._tx.reshape(-1, 3)
+        rx = self._rx.reshape(-1, 3)
+        for i in range(len(tx)):
+            rx[i] = self.spi.xfer2(tx[i].tolist())
+
+    def read_time(self):
+        """Seconds one read() keeps the bus busy at the configured clock."""
+        return len(self.channels) * self.num_average * CLOCKS_PER_CONVERSION / self.max_speed_hz
+
+    def read_raw(self):
+        """Returns all samples as array of shape (num_average, num_channels)."""
+        self._transfer()
+        return decode_frame(self._rx)
+
+    def read(self):
+        """Returns the reduced code of every channel as list of int."""
+        samples = self.read_raw()
+        reduced = REDUCTIONS[self.reduction](samples, self.trim_fraction)
+        return [int(v) for v in reduced]
+
+    def close(self):
+        self.spi.close()
+
+
+def decimate(samples):
+    """Returns per column statistics of a sample block of shape (n, num_channels)."""
+    count = samples.shape[0]
+    if count == 0:
+        return None
+    return {
+        "mean": samples.mean(axis=0),
+        "min": samples.min(axis=0),
+        "max": samples.max(axis=0),
+        "std": samples.std(axis=0),
+        "count": count,
+    }
+
+
+class AdcSampler:
+    """Samples an ADC at a fixed rate into a preallocated ring buffer.
+
+    take() returns all samples since its previous call, so the publish stage
+    can compute statistics over exactly one publish period.
+    """
+
+    def __init__(self, adc, rate, capacity, metrics=None, name="spi"):
+        self.adc = adc
+        self.rate = rate
+        self.capacity = capacity
+        self.metrics = metrics
+        self.name = name
+        self.overruns = 0
+
+        self._codes = np.zeros((capacity, len(adc.channels)), dtype=np.float64)
+        self._times = np.zeros(capacity, dtype=np.float64)
+        self._written = 0 # total number of samples ever written
+        self._taken = 0
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"adc-{self.name}")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=2):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        period = 1 / self.rate
+        next_time = time.monotonic()
+        while not self._stop_event.is_set():
+            timer = self.metrics.timer(self.name) if self.metrics else contextlib.nullcontext()
+            try:
+                with timer:
+                    codes = self.adc.read()
+            except OSError as e:
+                logger.error(f"While sampling ADC {self.name}: {e}.")
+                codes = None
+            if codes is not None:
+                with self._lock:
+                    i = self._written % self.capacity
+                    self._codes[i] = codes
+                    self._times[i] = time.time()
+                    self._written += 1
+
+            next_time += period
+            delay = next_time - time.monotonic()
+            if delay < 0:
+                # fell behind, do not try to catch up with a burst
+                self.overruns += 1
+                next_time = time.monotonic()
+                delay = 0
+            self._stop_event.wait(delay)
+
+    def latest_time(self):
+        """Returns the epoch time of the newest sample or None."""
+        with self._lock:
+            if self._written == 0:
+                return None
+            return float(self._times[(self._written - 1) % self.capacity])
+
+    def latest(self, default=None):
+        """Returns the newest codes as list of int."""
+        with self._lock:
+            if self._written == 0:
+                return default
+            return [int(v) for v in self._codes[(self._written - 1) % self.capacity]]
+
+    def take(self):
+        """Returns (times, codes) of all samples since the previous call, oldest first."""
+        with self._lock:
+            start = max(self._taken, self._written - self.capacity)
+            indices = np.arange(start, self._written) % self.capacity
+            self._taken = self._written
+            return self._times[indices], self._codes[indices]
+
+    def since(self, index=None):
+        """Returns (next index, times, codes) of the samples from index on, None for only the next index.
+
+        Unlike take() it can be called by any number of readers."""
+        with self._lock:
+            start = self._written if index is None else max(index, self._written - self.capacity)
+            indices = np.arange(start, self._written) % self.capacity
+            return self._written, self._times[indices], self._codes[indices]
+
+    def window(self, start, end):
+        """Returns (times, codes) of the buffered samples between the epoch times start and end, oldest first."""
+        with self._lock:
+            first = max(0, self._written - self.capacity)
+            indices = np.arange(first, self._written) % self.capacity
+            times = self._times[indices]
+            selected = indices[(times >= start) & (times <= end)]
+            return self._times[selected], self._codes[selected]
+
+
+class AdcBank:
+    """All ADC chips with their samplers, the channels are addressed by name."""
+
+    def __init__(self, samplers, channels):
+        """samplers is {chip: AdcSampler}, channels a list of AnalogChannel, in the order of the sampler columns."""
+        self.samplers = samplers
+        self.channels = channels
+        self._columns = {}
+        self._channels = {c.name: c for c in channels}
+        for chip, sampler in samplers.items():
+            chip_channels = [c for c in channels if c.chip == chip]
+            for column, channel in enumerate(chip_channels):
+                self._columns[channel.name] = (sampler, column)
+
+    def start(self):
+        for sampler in self.samplers.values():
+            sampler.start()
+
+    def stop(self):
+        for sampler in self.samplers.values():
+            sampler.stop()
+
+    def close(self):
+        for sampler in self.samplers.values():
+            sampler.adc.close()
+
+    def latest(self, name, default=0):
+        """Newest code of a channel."""
+        entry = self._columns.get(name)
+        if entry is None:
+            return default
+        sampler, column = entry
+        codes = sampler.latest()
+        return default if codes is None else codes[column]
+
+    def latest_time(self, name):
+        entry = self._columns.get(name)
+        return None if entry is None else entry[0].latest_time()
+
+    def channel(self, name):
+        return self._channels[name]
+
+    def since(self, name, index=None):
+        """Returns (next index, times, codes) of one channel, see AdcSampler.since()."""
+        sampler, column = self._columns[name]
+        index, times, codes = sampler.since(index)
+        return index, times, codes[:, column]
+
+    def window(self, name, start, end):
+        """Returns (times, codes) of one channel between the epoch times start and end."""
+        sampler, column = self._columns[name]
+        times, codes = sampler.window(start, end)
+        return times, codes[:, column]
+
+    def take(self):
+        """Returns {chip: (times, codes)} of all samples since the previous call, one column per channel."""
+        return {chip: sampler.take() for chip, sampler in self.samplers.items()}
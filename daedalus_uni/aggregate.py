@@ -0,0 +1,135 @@
+"""
+Daedalus project aggregation tiers
+
+Rolling aggregates of every channel over fixed windows, e.g. 10 s, 1 min
+and 10 min, for a downsampled bucket, so dashboards covering a whole
+beamtime read a small fraction of the raw points. Every sample updates
+mean, variance (Welford), min, max and last in O(1).
+
+Windows are aligned to multiples of their length since the epoch. A
+finished window is written as one point per channel with the measurement
+and static tags of the channel, the tag window (e.g. window=1m) and the
+start of the window as time. Booleans count as 0/1, so the mean of a
+shutter is the fraction of cycles it was open. Strings and values flagged
+stale are left out.
+
+2025 xaratustrah@github
+
+"""
+
+import math
+
+from .measurement import Point
+
+
+def window_name(seconds):
+    """10 -> 10s, 60 -> 1m, 3600 -> 1h"""
+    for unit, size in (("h", 3600), ("m", 60)):
+        if seconds >= size and seconds % size == 0:
+            return f"{seconds // size}{unit}"
+    return f"{seconds}s"
+
+
+class Accumulator:
+    __slots__ = ("count", "mean", "m2", "min", "max", "last")
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.last = None
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.last = value
+
+    def fields(self):
+        return {
+            "mean": self.mean,
+            "min": self.min,
+            "max": self.max,
+            "std": math.sqrt(self.m2 / self.count),
+            "last": self.last,
+            "count": self.count,
+        }
+
+
+class Tier:
+    """All channels over one window length."""
+
+    def __init__(self, seconds, measurement_prefix=""):
+        self.seconds = seconds
+        self.length = int(seconds * 1e9)
+        self.name = window_name(seconds)
+        self.measurement_prefix = measurement_prefix
+        self.start = None
+        self.accumulators = {}
+        self.points = {}
+
+    def add(self, key, point, value):
+        accumulator = self.accumulators.get(key)
+        if accumulator is None:
+            accumulator = self.accumulators[key] = Accumulator()
+            self.points[key] = Point(self.measurement_prefix + point.measurement,
+                                     {**point.static_tags, "window": self.name})
+        accumulator.add(value)
+        # string tags like the logging device of a feed follow the latest sample
+        tags = self.points[key].tags
+        for name, tag in point.tags.items():
+            if isinstance(tag, str):
+                tags[name] = tag
+
+    def finish(self):
+        """Returns the points of the current window and starts a new one."""
+        points = []
+        for key, accumulator in self.accumulators.items():
+            if accumulator.count:
+                point = self.points[key]
+                point.fields = accumulator.fields()
+                point.time = self.start
+                points.append(point)
+                accumulator.reset()
+        return points
+
+
+class Aggregator:
+    def __init__(self, windows=(10, 60, 600), measurement_prefix=""):
+        """windows in seconds, the prefix keeps the measurements apart when sharing the raw bucket."""
+        self.tiers = [Tier(seconds, measurement_prefix) for seconds in windows]
+
+    def add(self, timestamp, points):
+        """Adds one cycle of (key, Point) pairs, timestamp in ns.
+
+        Returns the points of all windows that ended before this cycle, they
+        are reused and have to be encoded before the next call."""
+        samples = []
+        for key, point in points:
+            value = point.fields.get("value")
+            if value is None or isinstance(value, str) or point.fields.get("stale"):
+                continue
+            value = float(value)
+            if not math.isnan(value):
+                samples.append((key, point, value))
+
+        finished = []
+        for tier in self.tiers:
+            start = timestamp - timestamp % tier.length
+            if tier.start != start:
+                if tier.start is not None:
+                    finished += tier.finish()
+                tier.start = start
+            for key, point, value in samples:
+                tier.add(key, point, value)
+        return finished
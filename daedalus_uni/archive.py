@@ -0,0 +1,258 @@
+"""
+Daedalus project local archive
+
+Measurements are stored column wise in compressed NumPy segments (.npz),
+one array per channel plus the time column. Segments are rotated by size
+or time, and a small index.json keeps the time range of each segment.
+Since every column is a separately compressed member of the segment, a
+reader only decompresses the channels it asks for.
+
+Until its segment is complete, the new rows are written every
+flush_seconds as a chunk, a small segment of its own in the index, so a
+crash loses at most that many seconds. A complete segment replaces its
+chunks.
+
+Columns are named key.field for fields, key.tag.name for numeric dynamic
+tags and key.time for the acquisition time of a point in ns. String
+values, static tags and the value types go into the segment metadata, so
+that the original points can be rebuilt.
+
+2025 xaratustrah@github
+
+"""
+
+import json
+import os
+import time
+import numpy as np
+from loguru import logger
+
+from .measurement import Point
+
+INDEX_FILE = "index.json"
+META_MEMBER = "__meta__"
+
+
+def value_type(value):
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, str):
+        return "str"
+    if isinstance(value, (int, np.integer)):
+        return "int"
+    return "float"
+
+
+def load_index(directory):
+    try:
+        with open(os.path.join(directory, INDEX_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+
+class ArchiveWriter:
+    def __init__(self, directory, max_rows=3600, rotate_seconds=3600, flush_seconds=60):
+        self.directory = directory
+        self.max_rows = max_rows
+        self.rotate_seconds = rotate_seconds
+        self.flush_seconds = flush_seconds
+        self.flushed = 0 # rows on disk, in segments or chunks
+        os.makedirs(directory, exist_ok=True)
+        self.index = load_index(directory)
+        self._reset()
+
+    def _reset(self):
+        self._rows = 0
+        self._columns = {"time": np.zeros(self.max_rows, dtype=np.int64)}
+        self._meta = {}
+        self._chunks = []
+        self._segment_start = self._chunk_start = time.monotonic()
+
+    def _column(self, name, dtype):
+        column = self._columns.get(name)
+        if column is None:
+            # channels that appear later are NaN (or 0 for times) before
+            column = np.zeros(self.max_rows, dtype=dtype)
+            if dtype == np.float64:
+                column[:] = np.nan
+            self._columns[name] = column
+        return column
+
+    def append(self, timestamp, points):
+        """Adds one row. points is an iterable of (key, Point), timestamp in ns."""
+        row = self._rows
+        self._columns["time"][row] = timestamp
+        for key, point in points:
+            meta = self._meta.get(key)
+            if meta is None:
+                meta = self._meta[key] = {
+                    "measurement": point.measurement,
+                    "static_tags": {k: str(v) for k, v in point.static_tags.items()},
+                    "string_tags": {}, "tag_types": {},
+                    "string_fields": {}, "field_types": {},
+                }
+            self._column(f"{key}.time", np.int64)[row] = point.time
+            for name, value in point.fields.items():
+                meta["field_types"][name] = value_type(value)
+                if isinstance(value, str):
+                    meta["string_fields"][name] = value
+                elif value is not None:
+                    self._column(f"{key}.{name}", np.float64)[row] = value
+            for name, value in point.tags.items():
+                meta["tag_types"][name] = value_type(value)
+                if isinstance(value, str):
+                    meta["string_tags"][name] = value
+                elif value is not None:
+                    self._column(f"{key}.tag.{name}", np.float64)[row] = value
+        self._rows += 1
+
+        now = time.monotonic()
+        if self._rows >= self.max_rows or now - self._segment_start >= self.rotate_seconds:
+            self.flush()
+        elif self.flush_seconds and now - self._chunk_start >= self.flush_seconds:
+            self.flush_chunk()
+
+    def _write(self, prefix, start, end):
+        """Writes rows start..end as a file, returns its index entry."""
+        times = self._columns["time"][start:end]
+        name = f"{prefix}-{int(times[0])}.npz"
+        path = os.path.join(self.directory, name)
+        arrays = {column: values[start:end] for column, values in self._columns.items()}
+        arrays[META_MEMBER] = np.array(json.dumps(self._meta))
+
+        with open(path + ".tmp", "wb") as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(path + ".tmp", path)
+        return {
+            "file": name,
+            "start": int(times.min()),
+            "end": int(times.max()),
+            "rows": end - start,
+            "channels": sorted(c for c in self._columns if c != "time"),
+        }
+
+    def _save_index(self):
+        with open(os.path.join(self.directory, INDEX_FILE + ".tmp"), "w") as f:
+            json.dump(self.index, f)
+        os.replace(os.path.join(self.directory, INDEX_FILE + ".tmp"), os.path.join(self.directory, INDEX_FILE))
+
+    def flush_chunk(self):
+        """Writes the rows since the last chunk as a chunk of the current segment."""
+        self._chunk_start = time.monotonic()
+        start = sum(entry["rows"] for entry in self._chunks)
+        if self._rows == start:
+            return
+        entry = self._write("chunk", start, self._rows)
+        self._chunks.append(entry)
+        self.index.append(entry)
+        self._save_index()
+        self.flushed += entry["rows"]
+
+    def flush(self):
+        """Writes the buffered rows as a new segment in place of its chunks."""
+        if self._rows == 0:
+            return
+        entry = self._write("segment", 0, self._rows)
+        self.flushed += self._rows - sum(chunk["rows"] for chunk in self._chunks)
+        chunks = {chunk["file"] for chunk in self._chunks}
+        self.index = [e for e in self.index if e["file"] not in chunks] + [entry]
+        self._save_index()
+        # files left by a crash here are not in the index
+        for name in chunks:
+            os.remove(os.path.join(self.directory, name))
+        logger.info(f"Archived {entry['rows']} rows to {os.path.join(self.directory, entry['file'])}")
+        self._reset()
+
+    def close(self):
+        self.flush()
+
+
+class ArchiveReader:
+    def __init__(self, directory):
+        self.directory = directory
+        self.index = load_index(directory)
+
+    def channels(self):
+        return sorted({c for entry in self.index for c in entry["channels"]})
+
+    def segments(self, start=None, end=None):
+        """Index entries overlapping [start, end] in ns, oldest first."""
+        for entry in sorted(self.index, key=lambda e: e["start"]):
+            if (start is None or entry["end"] >= start) and (end is None or entry["start"] <= end):
+                yield entry
+
+    def read_segment(self, entry, start=None, end=None, channels=None):
+        """Returns ({column: array}, meta) of one segment limited to the time range.
+
+        Only the time column and the requested channels are decompressed.
+        """
+        with np.load(os.path.join(self.directory, entry["file"])) as segment:
+            times = segment["time"]
+            lo = 0 if start is None else np.searchsorted(times, start, side="left")
+            hi = len(times) if end is None else np.searchsorted(times, end, side="right")
+            columns = {"time": times[lo:hi]}
+            for channel in entry["channels"] if channels is None else channels:
+                if channel in entry["channels"]:
+                    columns[channel] = segment[channel][lo:hi]
+            meta = json.loads(str(segment[META_MEMBER]))
+        return columns, meta
+
+    def read(self, start=None, end=None, channels=None):
+        """Returns {column: array} for the time range in ns, concatenated over all segments.
+        Channels missing in a segment are NaN there."""
+        parts = [self.read_segment(entry, start, end, channels)[0] for entry in self.segments(start, end)]
+        names = {"time"} | ({c for part in parts for c in part} if channels is None else set(channels))
+        result = {}
+        for name in names:
+            arrays = []
+            for part in parts:
+                if name in part:
+                    arrays.append(part[name])
+                else:
+                    arrays.append(np.full(len(part["time"]), np.nan))
+            result[name] = np.concatenate(arrays) if arrays else np.array([])
+        return result
+
+    def points(self, start=None, end=None):
+        """Rebuilds the original points, yields (row time, [Point, ...]) per row."""
+        for entry in self.segments(start, end):
+            yield from self.segment_points(entry, start, end)
+
+    def segment_points(self, entry, start=None, end=None, skip=0):
+        """Same as points() for one segment, skipping the first rows."""
+        columns, meta = self.read_segment(entry, start, end)
+        for row in range(skip, len(columns["time"])):
+            points = []
+            for key, m in meta.items():
+                point_time = columns.get(f"{key}.time")
+                if point_time is None or point_time[row] == 0:
+                    continue
+                point = Point(m["measurement"], m["static_tags"])
+                point.time = int(point_time[row])
+                for name, kind in m["field_types"].items():
+                    if kind == "str":
+                        point.fields[name] = m["string_fields"][name]
+                        continue
+                    value = columns.get(f"{key}.{name}")
+                    if value is None or np.isnan(value[row]):
+                        continue
+                    point.fields[name] = restore(value[row], kind)
+                for name, kind in m["tag_types"].items():
+                    if kind == "str":
+                        point.tags[name] = m["string_tags"][name]
+                        continue
+                    value = columns.get(f"{key}.tag.{name}")
+                    if value is None or np.isnan(value[row]):
+                        continue
+                    point.tags[name] = restore(value[row], kind)
+                points.append(point)
+            yield int(columns["time"][row]), points
+
+
+def restore(value, kind):
+    if kind == "bool":
+        return bool(value)
+    if kind == "int":
+        return int(value)
+    return float(value)
@@ -0,0 +1,235 @@
+"""
+Daedalus project benchmark
+
+Runs the threaded pipeline of the daemon against the simulators: the
+Scheduler polling every source in its own thread, the ADC sampler and the
+publish loop on a DeadlineTimer with the InfluxDB writer. It reports the
+per stage latencies of the self instrumentation, deadline and sampler
+overruns and memory growth.
+
+    python -m daedalus_uni.bench --cycles 2000 --period 0.05 --latency 0.001 --failure-rate 0.01
+
+The simulated ADC takes as long as the SPI transfers at --spi-speed, 0
+leaves out the clock time to measure only the processing.
+
+With --startup it instead measures the import time and the time from the
+start of the process to the first published cycle, each in a fresh
+interpreter against the simulators, and fails if --max-startup is
+exceeded.
+
+    python -m daedalus_uni.bench --startup --cfg daedalus_uni_cfg_defaults.toml --max-startup 2
+
+2025 xaratustrah@github
+
+"""
+
+import argparse
+import signal
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+from loguru import logger
+
+from .simulators import (
+    Faults, SimulatedGPIO, SimulatedSpiDev, LakeshoreSimulator,
+    MaxigaugeSimulator, SSESimulator, InfluxSimulator,
+)
+from .lakeshore import Lakeshore
+from .maxigauge import Maxigauge
+from .restapi import SnapshotStore, SSESubscriber
+from .adc import MCP3208, AdcSampler, decimate
+from .density import DensityEngine
+from .measurement import LineProtocolEncoder
+from .influx_writer import InfluxWriter
+from .metrics import Metrics
+from .scheduler import LatestValueStore, Scheduler, DeadlineTimer
+from .__main__ import create_points, get_feed_value, process_snapshots, add_statistics
+
+PINS = [16, 18, 22, 32, 33, 37]
+
+
+def report(metrics):
+    lines = [f"{'stage':<16}{'n':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+    for stage, histogram in sorted(metrics.histograms.items()):
+        errors = metrics.counters.get((stage, "errors"), 0) + metrics.counters.get((stage, "timeouts"), 0)
+        p50, p95, p99 = (histogram.quantile(q) * 1000 for q in (0.5, 0.95, 0.99))
+        lines.append(f"{stage:<16}{histogram.count:>8}{errors:>8}"
+                     f"{p50:>10.3f}{p95:>10.3f}{p99:>10.3f}{histogram.max * 1000:>10.3f}")
+    return "\n".join(lines)
+
+
+def run(cycles, faults, num_average=8, with_density=True, spi_speed=8000, period=0.05, sample_rate=10):
+    lakeshore_sim = LakeshoreSimulator(faults=faults).start()
+    maxigauge_sim = MaxigaugeSimulator(interval=0.05, faults=faults).start()
+    sse_sim = SSESimulator(device_name="GJ_S4", interval=0.05, faults=faults).start()
+    influx_sim = InfluxSimulator(faults=faults).start()
+    metrics = Metrics()
+
+    gpio = SimulatedGPIO(toggle_rate=1, faults=faults)
+    for pin in PINS:
+        gpio.setup(pin, gpio.IN)
+    # the simulated SPI takes as long as the real one, 0 for no clock time
+    spi = SimulatedSpiDev(faults=faults)
+    spi.max_speed_hz = spi_speed
+    adc = MCP3208(spi, max_speed_hz=spi_speed or 8000, num_average=num_average, channels=range(3))
+    sampler = AdcSampler(adc, rate=sample_rate, capacity=int(sample_rate * period * 4) + 1, metrics=metrics)
+
+    lakeshore = Lakeshore(lakeshore_sim.host, lakeshore_sim.port)
+    maxigauge = Maxigauge(maxigauge_sim.host, maxigauge_sim.port)
+    feeds = {"s4": ("GJ_S4", sse_sim.url)}
+    snapshot_store = SnapshotStore()
+    subscriber = SSESubscriber("s4", sse_sim.url, snapshot_store)
+
+    # the same threaded pipeline as the daemon, every source polled at the publish period
+    store = LatestValueStore()
+    scheduler = Scheduler(store, metrics)
+    scheduler.add("lakeshore", period, lambda: lakeshore.get_temperatures(["KRDG?A", "KRDG?B"]))
+    scheduler.add("gpio", period, lambda: [bool(gpio.input(pin)) for pin in PINS])
+    if with_density:
+        density_engine = DensityEngine("H2")
+
+        def poll_density():
+            t1_val, _ = store.get("lakeshore", (0, 0))
+            _, _, _, s3_val, s2_val, s1_val = maxigauge.get_pressures()
+            return density_engine.get_density(T=t1_val, p=10, S1=s1_val, S2=s2_val, S3=s3_val,
+                                              S4=get_feed_value(snapshot_store, "s4"))
+
+        scheduler.add("density", period, poll_density)
+
+    writer = InfluxWriter(influx_sim.url, "token", "org", "bucket", flush_interval=0.5, metrics=metrics)
+    encoder = LineProtocolEncoder()
+    points = create_points(feeds)
+
+    maxigauge.start()
+    subscriber.start()
+    sampler.start()
+    scheduler.start()
+    # let the streams deliver their first values
+    time.sleep(0.5)
+
+    tracemalloc.start()
+    memory_start = tracemalloc.get_traced_memory()[0]
+    deadline = DeadlineTimer(period, metrics)
+    start = time.perf_counter()
+
+    for _ in range(cycles):
+        cycle_start = time.perf_counter()
+        now = time.time_ns()
+        temperatures = store.get("lakeshore", (0, 0))
+        with metrics.timer("maxigauge"):
+            pressures = maxigauge.get_pressures()
+        _, sample_codes = sampler.take()
+        statistics = decimate(sample_codes)
+        codes = sampler.latest([0] * 3)
+        levels = store.get("gpio", [False] * len(PINS))
+        process_snapshots(snapshot_store, feeds, points, now)
+
+        for key, value in zip(("e1", "e2", "e3", "s3", "s2", "s1"), pressures):
+            points[key].set(value, now)
+        points["temperature1"].set(temperatures[0], now)
+        points["temperature2"].set(temperatures[1], now)
+        for column, key in enumerate(("xpos", "zpos", "nozzle_pressure")):
+            add_statistics(points[key].set(codes[column], now), statistics, column)
+        points["shutter_signal"].set(levels[4], now)
+        points["shutter_sensor"].set(levels[5], now)
+        points["density"].set(store.get("density", 0), now)
+
+        with metrics.timer("serialization"):
+            record = encoder.encode(points.values())
+        writer.write(record)
+        metrics.observe("publish", time.perf_counter() - cycle_start)
+        deadline.wait()
+
+    elapsed = time.perf_counter() - start
+    memory_end, memory_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    scheduler.stop()
+    sampler.stop()
+    writer.flush()
+    writer.close()
+    subscriber.stop()
+    maxigauge.stop()
+    lakeshore.close()
+    for sim in (lakeshore_sim, maxigauge_sim, sse_sim, influx_sim):
+        sim.stop()
+
+    print(report(metrics))
+    print()
+    print(f"cycles:          {cycles} in {elapsed:.2f} s, {cycles / elapsed:.1f} cycles/s at a period of {period} s")
+    print(f"overruns:        publish {deadline.overruns}, adc {sampler.overruns}")
+    print(f"memory growth:   {(memory_end - memory_start) / 1024:.1f} kB, peak {memory_peak / 1024:.1f} kB")
+    print(f"influx received: {influx_sim.lines} lines in {influx_sim.requests} requests")
+
+
+def startup(cfg, runs=5, max_startup=None):
+    """Returns False if the time to the first published cycle exceeded max_startup seconds."""
+    import_times = []
+    first_cycle_times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import daedalus_uni.__main__"], check=True)
+        import_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, "-m", "daedalus_uni", "--cfg", cfg, "--simulate"],
+                                   stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        for line in process.stdout:
+            if "First cycle published" in line:
+                first_cycle_times.append(time.perf_counter() - start)
+                break
+        process.send_signal(signal.SIGINT)
+        try:
+            process.communicate(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+
+    if len(first_cycle_times) < runs:
+        print(f"{runs - len(first_cycle_times)} of {runs} runs did not publish a cycle")
+        return False
+
+    lines = [f"{'':<14}{'min s':>10}{'p50 s':>10}{'max s':>10}"]
+    for name, times in (("import", import_times), ("first cycle", first_cycle_times)):
+        lines.append(f"{name:<14}{min(times):>10.3f}{np.median(times):>10.3f}{max(times):>10.3f}")
+    print("\n".join(lines))
+    if max_startup is not None and max(first_cycle_times) > max_startup:
+        print(f"first cycle after {max(first_cycle_times):.3f} s, more than {max_startup} s")
+        return False
+    return True
+
+
+def main():
+    logger.remove(0)
+    logger.add(sys.stderr, level="WARNING")
+
+    parser = argparse.ArgumentParser(description="Daedalus benchmark against simulated devices.")
+    parser.add_argument("--cycles", type=int, default=1000, help="Number of pipeline cycles")
+    parser.add_argument("--num-average", type=int, default=8, help="ADC samples per channel")
+    parser.add_argument("--period", type=float, default=0.05, help="Publish and poll period in seconds")
+    parser.add_argument("--sample-rate", type=float, default=10, help="ADC sample rate in Hz")
+    parser.add_argument("--spi-speed", type=int, default=8000, help="Simulated SPI clock in Hz, 0 for no clock time")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated device latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Simulated device jitter in seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Simulated failure probability")
+    parser.add_argument("--no-density", action="store_true", help="Skip the density stage, e.g. without voreas")
+    parser.add_argument("--startup", action="store_true", help="Measure import time and time to the first cycle instead")
+    parser.add_argument("--cfg", type=str, help="Configuration TOML file for --startup")
+    parser.add_argument("--runs", type=int, default=5, help="Number of starts for --startup")
+    parser.add_argument("--max-startup", type=float, help="Fail if the first cycle takes longer, in seconds")
+    args = parser.parse_args()
+
+    if args.startup:
+        if not args.cfg:
+            parser.error("--startup needs --cfg")
+        sys.exit(0 if startup(args.cfg, args.runs, args.max_startup) else 1)
+
+    faults = Faults(latency=args.latency, jitter=args.jitter, failure_rate=args.failure_rate)
+    run(args.cycles, faults, num_average=args.num_average, with_density=not args.no_density, spi_speed=args.spi_speed,
+        period=args.period, sample_rate=args.sample_rate)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+Daedalus project burst capture
+
+The ADC samplers keep their samples at the full rate in ring buffers.
+When a trigger fires, the samples from pre_trigger before to post_trigger
+after it are written as one batch with their own timestamps, together
+with the vacuum readings of that interval. Every sample point carries the
+tag trigger and the field offset, its time relative to the trigger in
+seconds, so bursts can be overlaid. A point <prefix>trigger marks the
+trigger itself.
+
+Triggers are edges of the digital inputs, e.g. the shutter or the limit
+switches, or an ADC channel crossing a threshold, detected on the single
+samples. A trigger is ignored within holdoff seconds of its previous one.
+
+2025 xaratustrah@github
+
+"""
+
+import contextlib
+import io
+import threading
+import time
+import numpy as np
+from loguru import logger
+
+from .measurement import Point
+
+POLL_INTERVAL = 0.02 # in seconds
+MAX_DELAY = 1 # in seconds, a capture does not wait longer for samples of a stalled ADC
+
+
+class EdgeTrigger:
+    def __init__(self, name, edge="both"):
+        """name of a digital input, edge is rising, falling or both."""
+        if edge not in ("rising", "falling", "both"):
+            raise ValueError(f"Invalid edge {edge!r} for trigger {name}")
+        self.name = name
+        self.edge = edge
+
+    def matches(self, event):
+        if event.name != self.name:
+            return False
+        return self.edge == "both" or (self.edge == "rising") == event.level
+
+
+class ThresholdTrigger:
+    def __init__(self, name, above=None, below=None):
+        """name of an analog channel, fires when its calibrated value rises above or falls below a level."""
+        if (above is None) == (below is None):
+            raise ValueError(f"Trigger {name} needs either above or below")
+        self.name = name
+        self.level = above if above is not None else below
+        self.rising = above is not None
+        self.index = None # next sample to scan, the first scan starts with the newest
+        self._beyond = None
+
+    def scan(self, times, values):
+        """Returns the time of the first crossing in the samples or None."""
+        beyond = values > self.level if self.rising else values < self.level
+        if not len(beyond):
+            return None
+        # the very first sample only sets the state
+        previous = np.concatenate(([beyond[0] if self._beyond is None else self._beyond], beyond[:-1]))
+        self._beyond = bool(beyond[-1])
+        crossings = np.flatnonzero(beyond & ~previous)
+        return float(times[crossings[0]]) if len(crossings) else None
+
+
+class BurstCapture:
+    def __init__(self, bank, channels, write, encoder, edge_triggers=(), threshold_triggers=(),
+                 pre_trigger=0.5, post_trigger=0.5, holdoff=None, vacuum=None, vacuum_points=None,
+                 measurement_prefix="burst_", metrics=None):
+        """Captures the AnalogChannels of an AdcBank around triggers, times in seconds.
+
+        write(lines) gets the line protocol of every burst. vacuum() returns
+        the buffered vacuum readings as [(epoch time, {key: value})], oldest
+        first, vacuum_points the {key: Point} with their measurement and tags."""
+        self.bank = bank
+        self.channels = channels
+        self.write = write
+        self.encoder = encoder
+        self.edge_triggers = list(edge_triggers)
+        self.threshold_triggers = list(threshold_triggers)
+        self.pre_trigger = pre_trigger
+        self.post_trigger = post_trigger
+        self.holdoff = pre_trigger + post_trigger if holdoff is None else holdoff
+        self.vacuum = vacuum
+        self.vacuum_points = vacuum_points or {}
+        self.measurement_prefix = measurement_prefix
+        self.metrics = metrics
+        self.captures = 0
+        self._points = {}
+        self._last = {}
+        self._pending = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="burst")
+        self._thread.daemon = True
+        self._thread.start()
+        logger.info(f"Burst capture of {', '.join(c.name for c in self.channels)} on "
+                    f"{', '.join(t.name for t in self.edge_triggers + self.threshold_triggers)}")
+        return self
+
+    def stop(self, timeout=2):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def edge(self, event):
+        """EdgeMonitor listener."""
+        for trigger in self.edge_triggers:
+            if trigger.matches(event):
+                self.fire(trigger.name, event.time)
+
+    def fire(self, name, timestamp):
+        """Starts a capture around timestamp in ns unless the trigger is in its holdoff."""
+        with self._lock:
+            last = self._last.get(name)
+            if last is not None and timestamp - last < self.holdoff * 1e9:
+                return False
+            self._last[name] = timestamp
+            self._pending.append((name, timestamp))
+        return True
+
+    def _run(self):
+        while not self._stop_event.wait(POLL_INTERVAL):
+            for trigger in self.threshold_triggers:
+                trigger.index, times, codes = self.bank.since(trigger.name, trigger.index)
+                channel = self.bank.channel(trigger.name)
+                crossing = trigger.scan(times, channel.calibration.convert(codes))
+                if crossing is not None:
+                    self.fire(trigger.name, int(crossing * 1e9))
+
+            with self._lock:
+                pending = list(self._pending)
+            for name, timestamp in pending:
+                if not self._complete(timestamp):
+                    continue
+                with self._lock:
+                    self._pending.remove((name, timestamp))
+                try:
+                    self.capture(name, timestamp)
+                except Exception as e:
+                    logger.error(f"While capturing the burst of {name}: {e}")
+
+    def _complete(self, timestamp):
+        """True once all channels have samples past the post trigger interval."""
+        end = timestamp / 1e9 + self.post_trigger
+        if time.time() > end + MAX_DELAY:
+            return True
+        return all((self.bank.latest_time(c.name) or 0) >= end for c in self.channels)
+
+    def _point(self, name, key, measurement, static_tags):
+        point = self._points.get((name, key))
+        if point is None:
+            point = self._points[(name, key)] = Point(self.measurement_prefix + measurement,
+                                                      {**static_tags, "trigger": name})
+        return point
+
+    def capture(self, name, timestamp):
+        """Writes the samples around a trigger at timestamp in ns as one batch."""
+        timer = self.metrics.timer("burst") if self.metrics else contextlib.nullcontext()
+        with timer:
+            samples = self._capture(name, timestamp)
+        self.captures += 1
+        if self.metrics:
+            self.metrics.increment("burst", "captures")
+        logger.info(f"Captured {samples} samples around {name}")
+
+    def _capture(self, name, timestamp):
+        start = timestamp / 1e9 - self.pre_trigger
+        end = timestamp / 1e9 + self.post_trigger
+        out = io.StringIO()
+        samples = 0
+
+        for channel in self.channels:
+            point = self._point(name, channel.name, channel.measurement, channel.static_tags)
+            times, codes = self.bank.window(channel.name, start, end)
+            values = channel.calibration.convert(codes)
+            for t, value in zip(times.tolist(), values.tolist()):
+                point.fields["value"] = value
+                point.fields["offset"] = t - timestamp / 1e9
+                point.time = int(t * 1e9)
+                samples += self.encoder.encode_point(point, out)
+
+        if self.vacuum is not None:
+            readings = self.vacuum()
+            # the last reading before the interval is still valid at its start
+            first = max([i for i, (t, _) in enumerate(readings) if t < start], default=0)
+            for t, values in readings[first:]:
+                if t > end:
+                    break
+                for key, value in values.items():
+                    template = self.vacuum_points[key]
+                    point = self._point(name, key, template.measurement, template.static_tags)
+                    point.fields["value"] = value
+                    point.fields["offset"] = t - timestamp / 1e9
+                    point.time = int(t * 1e9)
+                    samples += self.encoder.encode_point(point, out)
+
+        marker = self._point(name, "trigger", "trigger", {})
+        marker.fields.update(samples=samples, pre_trigger=self.pre_trigger, post_trigger=self.post_trigger)
+        marker.time = timestamp
+        self.encoder.encode_point(marker, out)
+
+        self.write(out.getvalue().rstrip("\n"))
+        return samples
@@ -0,0 +1,90 @@
+"""
+Daedalus project ADC calibration
+
+A calibration curve is compiled once into a lookup table with one entry
+per 12 bit ADC code. Converting a code or a whole block of samples is
+then a single NumPy gather, whatever the curve.
+
+Curves are given per channel in the config, either as piecewise-linear
+points, extrapolated linearly beyond the first and the last point
+
+    cal_points = [[0.64, 1.5, 3.23], [0, 20, 60]] # voltages, values
+
+or as polynomial coefficients in the voltage, lowest order first
+
+    polynomial = [-1.2, 25.0, 0.8]
+
+Values are clipped to the calibrated range unless clip = false, the
+range can be set with clip_range = [min, max]. A polynomial has no
+calibrated range, its values are clipped only to a given clip_range.
+
+2025 xaratustrah@github
+
+"""
+
+import numpy as np
+
+ADC_CODES = 4096
+VOLTAGE_RANGE = 3.3
+
+
+def code_voltages(adc_codes=ADC_CODES, voltage_range=VOLTAGE_RANGE):
+    """Voltage of every ADC code."""
+    return np.arange(adc_codes) / (adc_codes - 1) * voltage_range
+
+
+def piecewise_linear(voltages, cal_points):
+    v, x = (np.asarray(row, dtype=float) for row in cal_points)
+    if len(v) < 2 or len(v) != len(x):
+        raise ValueError("cal_points needs at least two voltages and as many values")
+    if not np.all(np.diff(v) > 0):
+        raise ValueError("cal_points voltages must be strictly increasing")
+    values = np.interp(voltages, v, x)
+    # np.interp holds the end values, continue the outer segments instead
+    below = voltages < v[0]
+    above = voltages > v[-1]
+    values[below] = x[0] + (voltages[below] - v[0]) * (x[1] - x[0]) / (v[1] - v[0])
+    values[above] = x[-1] + (voltages[above] - v[-1]) * (x[-1] - x[-2]) / (v[-1] - v[-2])
+    return values
+
+
+class Calibration:
+    def __init__(self, lut, clip_range=None):
+        self.clip_range = clip_range
+        if clip_range is not None:
+            lut = np.clip(lut, *clip_range)
+        self.lut = lut
+
+    @classmethod
+    def from_config(cls, spec, voltage_range=VOLTAGE_RANGE):
+        """Compiles the curve of a config table with cal_points or polynomial, clip and clip_range."""
+        voltages = code_voltages(voltage_range=voltage_range)
+        if "polynomial" in spec:
+            coefficients = np.asarray(spec["polynomial"], dtype=float)
+            lut = np.polynomial.polynomial.polyval(voltages, coefficients)
+            if "clip_range" not in spec:
+                if spec.get("clip", False):
+                    raise ValueError("clip of a polynomial needs clip_range")
+                return cls(lut)
+            calibrated = lut
+        elif "cal_points" in spec:
+            lut = piecewise_linear(voltages, spec["cal_points"])
+            calibrated = np.asarray(spec["cal_points"][1], dtype=float)
+        else:
+            raise ValueError("Calibration needs cal_points or polynomial")
+
+        clip_range = None
+        if spec.get("clip", True):
+            clip_range = tuple(spec.get("clip_range", (calibrated.min(), calibrated.max())))
+        return cls(lut, clip_range)
+
+    @classmethod
+    def constant(cls, value):
+        """Same value for every code, e.g. a fixed nozzle pressure."""
+        return cls(np.full(ADC_CODES, float(value)))
+
+    def convert(self, codes):
+        """Value of a code or an array of codes."""
+        if np.ndim(codes) == 0:
+            return float(self.lut[min(max(int(codes), 0), ADC_CODES - 1)])
+        return self.lut[np.clip(np.asarray(codes, dtype=np.intp), 0, ADC_CODES - 1)]
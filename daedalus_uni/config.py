@@ -0,0 +1,79 @@
+"""
+Daedalus project config loading
+
+Parsing and validating the TOML file is done once. The validated config
+is cached as a pickle in the user cache directory, keyed by the path,
+size and modification time of the file and of the modules next to the
+validation function, so later starts skip both steps until one of them
+changes.
+
+2025 xaratustrah@github
+
+"""
+
+import hashlib
+import os
+import pickle
+import toml
+from loguru import logger
+
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "daedalus")
+
+
+def plain(value):
+    """Copy with plain dicts, toml creates its own dict classes for inline tables that cannot be pickled."""
+    if isinstance(value, dict):
+        return {k: plain(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [plain(v) for v in value]
+    return value
+
+
+def cache_key(path, validate):
+    stat = os.stat(path)
+    key = hashlib.sha1(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+    # a changed validation or any helper it calls invalidates the cache as well
+    package = os.path.dirname(os.path.abspath(validate.__code__.co_filename))
+    for name in sorted(os.listdir(package)):
+        if name.endswith(".py"):
+            stat = os.stat(os.path.join(package, name))
+            key.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return key.hexdigest()
+
+
+def cache_file(path, cache_dir=CACHE_DIR):
+    """One cache file per config file."""
+    name = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, f"config-{name}.pickle")
+
+
+def load_config(path, validate, cache_dir=CACHE_DIR):
+    """Returns the validated config of a TOML file, validate(config) raises ValueError on errors."""
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"TOML file not found: {path}")
+    key = cache_key(path, validate)
+    filename = cache_file(path, cache_dir) if cache_dir else None
+
+    if filename is not None:
+        try:
+            with open(filename, "rb") as f:
+                cached_key, config = pickle.load(f)
+            if cached_key == key:
+                return config
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Ignoring config cache {filename}: {e}")
+
+    config = plain(toml.load(path))
+    validate(config)
+
+    if filename is not None:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(filename + ".tmp", "wb") as f:
+                pickle.dump((key, config), f)
+            os.replace(filename + ".tmp", filename)
+        except (OSError, pickle.PicklingError) as e:
+            logger.warning(f"Could not cache config: {e}")
+    return config
@@ -0,0 +1,95 @@
+"""
+Daedalus project deadband filter
+
+Points are only written to InfluxDB when their value has changed by more
+than the deadband of the channel, when a flag changes (e.g. a limit switch
+tag or the stale field) or when the heartbeat interval has passed since the last write,
+so a quiet channel still shows up regularly. Booleans are written on
+change only, without heartbeat. Numeric tags like raw follow their value and are not
+compared.
+
+The deadband is max(abs, rel * |last value|), both default to 0, which
+suppresses only unchanged values.
+
+2025 xaratustrah@github
+
+"""
+
+import math
+
+
+class Deadband:
+    __slots__ = ("absolute", "relative", "value", "flags", "time")
+
+    def __init__(self, absolute=0.0, relative=0.0):
+        self.absolute = absolute
+        self.relative = relative
+        self.value = None
+        self.flags = None
+        self.time = None
+
+
+def flags(point):
+    """The tags and fields besides value compared for changes, booleans and strings."""
+    result = {k: v for k, v in point.tags.items() if isinstance(v, (bool, str))}
+    result.update((f"field.{k}", v) for k, v in point.fields.items()
+                  if k != "value" and isinstance(v, (bool, str)))
+    return result
+
+
+def changed(last, value, band):
+    if isinstance(value, (bool, str)) or isinstance(last, (bool, str)):
+        return value != last
+    if value is None or last is None:
+        return value is not last
+    last_nan = isinstance(last, float) and math.isnan(last)
+    if isinstance(value, float) and math.isnan(value):
+        return not last_nan
+    if last_nan:
+        return True
+    return abs(value - last) > max(band.absolute, band.relative * abs(last))
+
+
+class DeadbandFilter:
+    def __init__(self, heartbeat=60, absolute=0.0, relative=0.0, channels=None, metrics=None):
+        """channels maps the point keys to {"abs": ..., "rel": ...}, heartbeat in seconds."""
+        self.heartbeat = int(heartbeat * 1e9)
+        self.default = (absolute, relative)
+        self.channels = channels or {}
+        self.metrics = metrics
+        self.suppressed = 0
+        self._bands = {}
+
+    def band(self, key):
+        band = self._bands.get(key)
+        if band is None:
+            settings = self.channels.get(key, {})
+            band = self._bands[key] = Deadband(settings.get("abs", self.default[0]),
+                                               settings.get("rel", self.default[1]))
+        return band
+
+    def accept(self, key, point):
+        """Returns True if the point has to be written and remembers it as the last written one."""
+        band = self.band(key)
+        value = point.fields.get("value")
+        point_flags = flags(point)
+        if band.time is not None and point_flags == band.flags and not changed(band.value, value, band):
+            # booleans like the shutter state are written on change only
+            if isinstance(value, bool) or point.time - band.time < self.heartbeat:
+                return False
+        band.value = value
+        band.flags = point_flags
+        band.time = point.time
+        return True
+
+    def filter(self, points):
+        """Yields the points of (key, Point) pairs that have to be written."""
+        suppressed = 0
+        for key, point in points:
+            if self.accept(key, point):
+                yield point
+            else:
+                suppressed += 1
+        self.suppressed += suppressed
+        if self.metrics and suppressed:
+            self.metrics.increment("deadband", "suppressed", suppressed)
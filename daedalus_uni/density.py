@@ -0,0 +1,204 @@
+"""
+Daedalus project density engine
+
+Wraps voreas get_density_value. A grid over (T, p) is computed once in a
+background thread for the configured gas species and the vacuum values
+at that time, optionally saved to disk. Each cycle is then answered by
+bilinear interpolation. Exact repeats are memoized, and values outside
+the grid or with vacuum values that moved away from the reference of the
+grid go to the direct call.
+
+The grid is only used while every vacuum value is within s_tolerance
+(relative) of the reference it was built for, the reference itself is
+rounded to three digits. The density is then the one for vacuum values up
+to s_tolerance + 0.5 % away from the live ones. A grid is computed at
+most once per min_rebuild_interval, saved grids are loaded any time, and
+only the max_cache_files most recently used ones are kept on disk. A
+failed build is retried with exponential backoff. Direct calls are used
+meanwhile.
+
+2025 xaratustrah@github
+
+"""
+
+import functools
+import glob
+import hashlib
+import os
+import threading
+import time
+import numpy as np
+from loguru import logger
+
+
+def get_density_value(**kwargs):
+    # voreas pulls in a large scientific stack, import it only when needed
+    from voreas.tools import get_density_value
+    return get_density_value(**kwargs)
+
+
+def voreas_version():
+    try:
+        from importlib.metadata import version
+        return version("voreas")
+    except Exception:
+        return "unknown"
+
+
+def interpolate(t_axis, p_axis, grid, T, p):
+    """Bilinear interpolation on a regular grid, T and p may be arrays. Returns NaN outside the grid."""
+    T = np.asarray(T, dtype=float)
+    p = np.asarray(p, dtype=float)
+    inside = (T >= t_axis[0]) & (T <= t_axis[-1]) & (p >= p_axis[0]) & (p <= p_axis[-1])
+
+    i = np.clip(np.searchsorted(t_axis, T) - 1, 0, len(t_axis) - 2)
+    j = np.clip(np.searchsorted(p_axis, p) - 1, 0, len(p_axis) - 2)
+    wt = (T - t_axis[i]) / (t_axis[i + 1] - t_axis[i])
+    wp = (p - p_axis[j]) / (p_axis[j + 1] - p_axis[j])
+
+    value = (
+        grid[i, j] * (1 - wt) * (1 - wp)
+        + grid[i + 1, j] * wt * (1 - wp)
+        + grid[i, j + 1] * (1 - wt) * wp
+        + grid[i + 1, j + 1] * wt * wp
+    )
+    return np.where(inside, value, np.nan)
+
+
+class DensityEngine:
+    def __init__(self, species, t_range=(10, 300), t_steps=60, p_range=(0, 60), p_steps=61,
+                 s_tolerance=0.02, cache_dir="", memo_size=1024, min_backoff=60, max_backoff=3600,
+                 min_rebuild_interval=600, max_cache_files=20):
+        self.species = species
+        self.t_axis = np.linspace(t_range[0], t_range[1], t_steps)
+        self.p_axis = np.linspace(p_range[0], p_range[1], p_steps)
+        self.s_tolerance = s_tolerance
+        self.cache_dir = cache_dir
+
+        self.grid = None
+        self.s_ref = None
+        self.grid_hits = 0
+        self.direct_calls = 0
+
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self._backoff = min_backoff
+        self._retry_time = None
+        self.min_rebuild_interval = min_rebuild_interval
+        self.max_cache_files = max_cache_files
+        self._computed_time = None
+
+        self._building = False
+        self._lock = threading.Lock()
+        self._direct = functools.lru_cache(maxsize=memo_size)(self._direct_uncached)
+
+    def _direct_uncached(self, T, p, S1, S2, S3, S4):
+        self.direct_calls += 1
+        return get_density_value(name=self.species, T=T, p=p, S1=S1, S2=S2, S3=S3, S4=S4)
+
+    def cache_file(self, s_ref):
+        key = f"{self.species}-{voreas_version()}-{self.t_axis.tolist()}-{self.p_axis.tolist()}-{list(s_ref)}"
+        digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"density_{self.species}_{digest}.npz")
+
+    def _s_matches(self, s_values):
+        if self.s_ref is None:
+            return False
+        ref = np.asarray(self.s_ref)
+        s = np.asarray(s_values)
+        return bool(np.all(np.abs(s - ref) <= self.s_tolerance * np.abs(ref)))
+
+    def _load(self, s_ref):
+        if not self.cache_dir:
+            return None
+        name = self.cache_file(s_ref)
+        if not os.path.exists(name):
+            return None
+        try:
+            grid = np.load(name)["grid"]
+            # the modification time orders the saved grids by last use
+            os.utime(name)
+            return grid
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Could not load density grid {name}: {e}")
+            return None
+
+    def _save(self, s_ref, grid):
+        if not self.cache_dir:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        name = self.cache_file(s_ref)
+        np.savez(name, grid=grid, t_axis=self.t_axis, p_axis=self.p_axis, s_ref=np.asarray(s_ref))
+        logger.info(f"Density grid saved to {name}")
+        saved = sorted(glob.glob(os.path.join(self.cache_dir, "density_*.npz")), key=os.path.getmtime)
+        for old in saved[:max(len(saved) - self.max_cache_files, 0)]:
+            os.remove(old)
+
+    def build(self, s_ref):
+        """Computes (or loads) the grid for the given S1..S4. Points where voreas fails are NaN."""
+        try:
+            grid = self._compute(s_ref)
+        except Exception as e:
+            logger.error(f"While building density grid: {e}. Using direct calls, retrying in {self._backoff} s.")
+            with self._lock:
+                self._retry_time = time.monotonic() + self._backoff
+                self._backoff = min(self._backoff * 2, self.max_backoff)
+                self._building = False
+            return
+        with self._lock:
+            self.grid = grid
+            self.s_ref = tuple(s_ref)
+            self._backoff = self.min_backoff
+            self._retry_time = None
+            self._building = False
+
+    def _compute(self, s_ref):
+        grid = self._load(s_ref)
+        if grid is None:
+            self._computed_time = time.monotonic()
+            logger.info(f"Building density grid for {self.species} with {self.t_axis.size}x{self.p_axis.size} points")
+            grid = np.full((self.t_axis.size, self.p_axis.size), np.nan)
+            for i, T in enumerate(self.t_axis):
+                for j, p in enumerate(self.p_axis):
+                    try:
+                        grid[i, j] = get_density_value(name=self.species, T=T, p=p,
+                                                       S1=s_ref[0], S2=s_ref[1], S3=s_ref[2], S4=s_ref[3])
+                    except ImportError:
+                        raise
+                    except Exception:
+                        pass
+            if np.all(np.isnan(grid)):
+                raise ValueError("voreas failed on every grid point")
+            self._save(s_ref, grid)
+        return grid
+
+    def _build_in_background(self, s_ref):
+        with self._lock:
+            now = time.monotonic()
+            if self._building or (self._retry_time is not None and now < self._retry_time):
+                return
+            # computing is rate limited, loading a saved grid is not
+            recent = self._computed_time is not None and now - self._computed_time < self.min_rebuild_interval
+            if recent and not (self.cache_dir and os.path.exists(self.cache_file(s_ref))):
+                return
+            self._building = True
+        thread = threading.Thread(target=self.build, args=(tuple(s_ref),), name="density-grid")
+        thread.daemon = True
+        thread.start()
+
+    def get_density(self, T, p, S1, S2, S3, S4):
+        s_values = (S1, S2, S3, S4)
+        with self._lock:
+            grid = self.grid if self._s_matches(s_values) else None
+
+        if grid is not None:
+            value = float(interpolate(self.t_axis, self.p_axis, grid, T, p))
+            if not np.isnan(value):
+                self.grid_hits += 1
+                return value
+        elif min(s_values) > 0 and self.s_tolerance > 0:
+            # no grid yet or the vacuum moved away from the reference. The
+            # reference is rounded to three digits, so saved grids get reused.
+            self._build_in_background(tuple(float(f"{s:.2e}") for s in s_values))
+
+        return self._direct(float(T), float(p), float(S1), float(S2), float(S3), float(S4))
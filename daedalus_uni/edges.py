@@ -0,0 +1,152 @@
+"""
+Daedalus project GPIO edge capture
+
+The digital inputs are watched with edge interrupts instead of being
+sampled once per cycle. Every transition is timestamped inside the
+callback, queued and handed to the listeners by a dispatch thread, so a
+slow listener never delays the capture. The current state of all inputs
+is kept for the publish loop. A periodic resync reads all pins and
+catches edges that were lost otherwise.
+
+Short pulses: an interrupt whose pin already reads the level set by the
+previous interrupt was a pulse that ended before the callback ran. It is
+queued as the two transitions, at the interrupt time and at the time of
+the read. A level set by a read of the resync or the recheck may already
+be the one of the interrupt, then only that level is recorded. The
+second edge of a pulse shorter than the bouncetime is suppressed by the
+debounce, so every pin is read again once its bouncetime has passed.
+
+2025 xaratustrah@github
+
+"""
+
+import queue
+import threading
+import time
+from collections import namedtuple
+from loguru import logger
+
+EdgeEvent = namedtuple("EdgeEvent", ["name", "pin", "level", "time"])
+
+
+class EdgeMonitor:
+    def __init__(self, gpio, inputs, bouncetime=5, inverted=(), metrics=None):
+        """inputs is a list of (name, pin), levels of inverted pins are negated, bouncetime in ms."""
+        self.gpio = gpio
+        self.inputs = list(inputs)
+        self.bouncetime = bouncetime
+        self.inverted = set(inverted)
+        self.metrics = metrics
+        self.events = queue.Queue()
+        self._names = {pin: name for name, pin in self.inputs}
+        self._levels = {}
+        self._times = {}
+        self._sources = {} # pin: "interrupt" or "poll", whichever set the current level
+        self._rechecks = {} # pin: monotonic time to read it again after an edge
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def subscribe(self, func):
+        """func(event) is called from the dispatch thread for every edge."""
+        self._listeners.append(func)
+
+    def start(self):
+        self.resync()
+        for _, pin in self.inputs:
+            self.gpio.add_event_detect(pin, self.gpio.BOTH, callback=self._edge, bouncetime=self.bouncetime)
+        self._thread = threading.Thread(target=self._run, name="gpio-edges")
+        self._thread.daemon = True
+        self._thread.start()
+        logger.info(f"Edge detection on pins {[pin for _, pin in self.inputs]}, bouncetime {self.bouncetime} ms")
+
+    def stop(self, timeout=2):
+        for _, pin in self.inputs:
+            try:
+                self.gpio.remove_event_detect(pin)
+            except Exception:
+                pass
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _read(self, pin):
+        return bool(self.gpio.input(pin)) != (pin in self.inverted)
+
+    def _edge(self, pin):
+        # runs in the interrupt thread, take the time first
+        timestamp = time.time_ns()
+        try:
+            level = self._read(pin)
+        except Exception as e:
+            logger.error(f"While reading pin {pin} after an edge: {e}")
+            return
+        read_time = max(time.time_ns(), timestamp + 1)
+        with self._lock:
+            pulse = self._levels.get(pin) == level and self._sources.get(pin) == "interrupt"
+            self._rechecks[pin] = time.monotonic() + self.bouncetime / 1000
+        if pulse:
+            # the pulse was over before the pin was read
+            self._record(pin, not level, timestamp, "interrupt")
+            self._record(pin, level, read_time, "interrupt")
+        else:
+            self._record(pin, level, timestamp, "interrupt")
+
+    def _record(self, pin, level, timestamp, source="poll"):
+        with self._lock:
+            if self._levels.get(pin) == level:
+                return
+            first = pin not in self._levels
+            self._levels[pin] = level
+            self._times[pin] = timestamp
+            self._sources[pin] = source
+        if not first:
+            self.events.put(EdgeEvent(self._names[pin], pin, level, timestamp))
+
+    def _recheck(self):
+        """Reads the pins whose bouncetime has passed, returns the seconds until the next one is due."""
+        now = time.monotonic()
+        with self._lock:
+            due = [pin for pin, at in self._rechecks.items() if at <= now]
+            for pin in due:
+                del self._rechecks[pin]
+            next_due = min(self._rechecks.values(), default=now + 0.1)
+        for pin in due:
+            try:
+                self._record(pin, self._read(pin), time.time_ns())
+            except Exception as e:
+                logger.error(f"While reading pin {pin} after its bouncetime: {e}")
+        return min(max(next_due - now, 0), 0.1)
+
+    def resync(self):
+        """Reads all pins, changes that were not seen as an edge are queued as events. Returns state()."""
+        for _, pin in self.inputs:
+            timestamp = time.time_ns()
+            self._record(pin, self._read(pin), timestamp)
+        return self.state()
+
+    def state(self):
+        """Current levels in the order of the inputs."""
+        with self._lock:
+            return [self._levels.get(pin, False) for _, pin in self.inputs]
+
+    def latest_time(self):
+        """Epoch time in ns of the last transition, None before the first reading."""
+        with self._lock:
+            return max(self._times.values(), default=None)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                event = self.events.get(timeout=self._recheck())
+            except queue.Empty:
+                continue
+            if self.metrics:
+                self.metrics.increment("gpio", "edges")
+                self.metrics.observe("gpio_edge_dispatch", (time.time_ns() - event.time) / 1e9)
+            for listener in self._listeners:
+                try:
+                    listener(event)
+                except Exception as e:
+                    logger.error(f"While handling edge on {event.name}: {e}")
@@ -0,0 +1,51 @@
+"""
+Daedalus project hardware backends
+
+Selects between the real Raspberry Pi hardware and the simulators. The
+hardware modules are only imported when the "rpi" backend is used, so
+the rest of the system runs anywhere.
+
+2025 xaratustrah@github
+
+"""
+
+BACKENDS = ("rpi", "sim")
+
+
+def is_raspberry_pi():
+    try:
+        with open("/proc/device-tree/model", "r") as model_file:
+            if "Raspberry Pi" in model_file.read():
+                return True
+    except FileNotFoundError:
+        pass
+    return False
+
+
+def check_backend(backend):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown hardware backend {backend}, choose from {', '.join(BACKENDS)}")
+    if backend == "rpi" and not is_raspberry_pi():
+        raise RuntimeError("This code is designed for a Raspberry Pi. Use the sim backend elsewhere.")
+
+
+def load_gpio(backend, faults=None):
+    """Returns an object with the RPi.GPIO interface."""
+    if backend == "sim":
+        from .simulators import SimulatedGPIO
+        return SimulatedGPIO(faults=faults)
+    import RPi.GPIO as GPIO
+    return GPIO
+
+
+def open_spi(backend, spi_bus, spi_cs, max_speed_hz, faults=None):
+    """Returns an opened object with the spidev.SpiDev interface."""
+    if backend == "sim":
+        from .simulators import SimulatedSpiDev
+        spi = SimulatedSpiDev(faults=faults)
+    else:
+        import spidev
+        spi = spidev.SpiDev()
+    spi.open(spi_bus, spi_cs)
+    spi.max_speed_hz = max_speed_hz
+    return spi
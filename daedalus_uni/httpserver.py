@@ -0,0 +1,161 @@
+"""
+Daedalus project live HTTP endpoint
+
+A small asyncio HTTP server in its own thread serving the latest values
+from memory:
+
+    GET /latest   JSON snapshot of all channels, keyed like the archive
+    GET /stream   server sent events, one snapshot per publish cycle and
+                  one gpio_event per digital input edge
+
+The snapshot is serialized once per update and the same bytes are sent
+to every client, so the cost per cycle does not grow with the number of
+dashboards. Slow clients skip snapshots instead of queueing them.
+
+2025 xaratustrah@github
+
+"""
+
+import asyncio
+import json
+import math
+import threading
+from loguru import logger
+
+HEARTBEAT = 15 # in seconds, keeps proxies from closing idle streams
+CLIENT_QUEUE = 4
+
+
+def clean(value):
+    """JSON has no NaN and no numpy scalars."""
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def serialize(points):
+    """Returns {key: flat point} of an iterable of (key, Point) as JSON bytes."""
+    snapshot = {key: {k: clean(v) for k, v in point.to_dict().items()} for key, point in points}
+    return json.dumps(snapshot, separators=(",", ":")).encode()
+
+
+class LiveServer:
+    def __init__(self, host="0.0.0.0", port=8080):
+        self.host = host
+        self.port = port
+        self.clients = set()
+        self._latest = b"{}"
+        self._event_id = 0
+        self._loop = None
+        self._server = None
+        self._ready = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="http-server")
+        self._thread.daemon = True
+        self._thread.start()
+        self._ready.wait(5)
+        return self
+
+    def stop(self, timeout=2):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def update(self, points):
+        """Serializes a new snapshot from (key, Point) pairs and sends it to all streams."""
+        body = serialize(points)
+        self._latest = body
+        self._broadcast(b"data: " + body + b"\n\n")
+
+    def event(self, key, point):
+        """Sends a single point as a named event, e.g. an edge."""
+        body = serialize([(key, point)])
+        self._broadcast(b"event: " + point.measurement.encode() + b"\ndata: " + body + b"\n\n")
+
+    def _broadcast(self, frame):
+        if self._loop is None or not self.clients:
+            return
+        self._loop.call_soon_threadsafe(self._send_all, frame)
+
+    def _send_all(self, frame):
+        self._event_id += 1
+        frame = f"id: {self._event_id}\n".encode() + frame
+        for queue in self.clients:
+            if queue.full():
+                # drop the oldest, a late snapshot is worthless
+                queue.get_nowait()
+            queue.put_nowait(frame)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host, self.port))
+            logger.info(f"Serving /latest and /stream on {self.host}:{self.port}")
+        except OSError as e:
+            logger.error(f"Could not start HTTP server on {self.host}:{self.port}: {e}")
+            self._loop = None
+            return
+        finally:
+            self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._server.close()
+            # open streams end with the loop
+            tasks = asyncio.all_tasks(self._loop)
+            for task in tasks:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self._loop.close()
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 10)
+            method, path, *_ = request.split(b"\r\n", 1)[0].decode().split(" ")
+            path = path.split("?", 1)[0]
+            if method != "GET":
+                await self._respond(writer, "405 Method Not Allowed", b"")
+            elif path == "/latest":
+                await self._respond(writer, "200 OK", self._latest, "application/json")
+            elif path == "/stream":
+                await self._stream(writer)
+            else:
+                await self._respond(writer, "404 Not Found", b"")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError,
+                ConnectionError, ValueError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, body, content_type="text/plain"):
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                     f"Content-Length: {len(body)}\r\nAccess-Control-Allow-Origin: *\r\n"
+                     f"Connection: close\r\n\r\n".encode() + body)
+        await writer.drain()
+
+    async def _stream(self, writer):
+        queue = asyncio.Queue(CLIENT_QUEUE)
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                     b"Cache-Control: no-cache\r\nAccess-Control-Allow-Origin: *\r\n"
+                     b"Connection: keep-alive\r\n\r\n")
+        # a new client gets the current snapshot right away
+        writer.write(b"data: " + self._latest + b"\n\n")
+        await writer.drain()
+        self.clients.add(queue)
+        try:
+            while True:
+                try:
+                    frame = await asyncio.wait_for(queue.get(), HEARTBEAT)
+                except asyncio.TimeoutError:
+                    frame = b": heartbeat\n\n"
+                writer.write(frame)
+                await writer.drain()
+        finally:
+            self.clients.discard(queue)
@@ -0,0 +1,210 @@
+"""
+Daedalus project InfluxDB writer
+
+One long-lived client with a background flush thread. Lines are batched by
+size and time and sent gzip compressed. If InfluxDB is unreachable, batches
+go to a bounded on-disk spool of append-only segment files which is drained
+in bulk as soon as the server is back.
+
+influxdb_client is imported and the client created in the writer thread,
+lines written before it is ready are queued, so the start of the
+acquisition does not wait for it.
+
+2025 xaratustrah@github
+
+"""
+
+import contextlib
+import os
+import glob
+import queue
+import threading
+import time
+from loguru import logger
+
+
+class Spool:
+    """Bounded spool of append-only line protocol segment files."""
+
+    def __init__(self, directory, max_bytes=100 * 1024 * 1024, segment_bytes=4 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self._file = None
+        os.makedirs(directory, exist_ok=True)
+
+    def segments(self):
+        """Returns the segment file names, oldest first."""
+        return sorted(glob.glob(os.path.join(self.directory, "spool-*.lp")))
+
+    def size(self):
+        return sum(os.path.getsize(f) for f in self.segments())
+
+    def __len__(self):
+        return len(self.segments())
+
+    def append(self, lines):
+        if self._file is None or self._file.tell() >= self.segment_bytes:
+            self.close_segment()
+            self._enforce_limit()
+            name = os.path.join(self.directory, f"spool-{time.time_ns()}.lp")
+            self._file = open(name, "a")
+        self._file.write("\n".join(lines) + "\n")
+        self._file.flush()
+
+    def close_segment(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _enforce_limit(self):
+        segments = self.segments()
+        total = sum(os.path.getsize(f) for f in segments)
+        while segments and total + self.segment_bytes > self.max_bytes:
+            oldest = segments.pop(0)
+            total -= os.path.getsize(oldest)
+            os.remove(oldest)
+            logger.warning(f"Spool full, dropped oldest segment {oldest}")
+
+    def drain(self, write_func, chunk_lines=5000):
+        """Sends all segments oldest first. A segment is removed only after it has been written completely."""
+        self.close_segment()
+        for segment in self.segments():
+            with open(segment) as f:
+                lines = [line for line in f.read().splitlines() if line]
+            for i in range(0, len(lines), chunk_lines):
+                write_func(lines[i:i + chunk_lines])
+            os.remove(segment)
+            logger.info(f"Drained {len(lines)} spooled lines from {segment}")
+
+
+class InfluxWriter:
+    def __init__(self, url, token, org, bucket, batch_size=500, flush_interval=2,
+                 retry_interval=10, timeout=5, write_precision="s",
+                 spool_dir=None, spool_max_bytes=100 * 1024 * 1024, debug=False, metrics=None,
+                 name="influx_write"):
+        self.bucket = bucket
+        self.org = org
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_interval = retry_interval
+        self.write_precision = write_precision
+        self.metrics = metrics
+        self.name = name # metrics stage
+        self.spool = Spool(spool_dir, max_bytes=spool_max_bytes) if spool_dir else None
+
+        self._client_options = dict(url=url, token=token, org=org, timeout=int(timeout * 1000),
+                                    enable_gzip=True, debug=debug)
+        self.client = None
+        self.write_api = None
+
+        # lines queued and lines sent, spooled or given up, in order
+        self.written = 0
+        self.delivered = 0
+
+        self._queue = queue.Queue()
+        self._flush_request = threading.Event()
+        self._stop_event = threading.Event()
+        self._next_retry = 0
+        self._thread = threading.Thread(target=self._run, name="influx-writer")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def write(self, record):
+        """Queues a line protocol string (one or more lines) or a list of lines. Never blocks.
+
+        Returns the number of lines written so far, they are delivered once delivered reaches it."""
+        if isinstance(record, str):
+            record = record.splitlines()
+        for line in record:
+            self._queue.put(line)
+            self.written += 1
+        return self.written
+
+    def flush(self):
+        self._flush_request.set()
+
+    def close(self, timeout=10):
+        self._stop_event.set()
+        self._flush_request.set()
+        self._thread.join(timeout)
+        if self.spool is not None:
+            self.spool.close_segment()
+        if self.client is not None:
+            self.client.close()
+
+    def _connect(self):
+        from influxdb_client import InfluxDBClient
+        from influxdb_client.client.write_api import SYNCHRONOUS
+        self.client = InfluxDBClient(**self._client_options)
+        self.write_api = self.client.write_api(write_options=SYNCHRONOUS)
+
+    def _send(self, lines):
+        timer = self.metrics.timer(self.name) if self.metrics else contextlib.nullcontext()
+        with timer:
+            self._write(lines)
+
+    def _write(self, lines):
+        self.write_api.write(bucket=self.bucket, org=self.org, record="\n".join(lines),
+                             write_precision=self.write_precision)
+
+    def _take_batch(self):
+        lines = []
+        while len(lines) < self.batch_size:
+            try:
+                lines.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return lines
+
+    def _run(self):
+        try:
+            self._connect()
+        except ImportError as e:
+            logger.error(f"Cannot write to InfluxDB: {e}")
+            return
+        last_flush = time.monotonic()
+        while True:
+            self._flush_request.wait(timeout=0.1)
+            now = time.monotonic()
+            due = self._flush_request.is_set() or now - last_flush >= self.flush_interval
+            if not due and self._queue.qsize() < self.batch_size:
+                continue
+            self._flush_request.clear()
+            last_flush = now
+
+            while True:
+                batch = self._take_batch()
+                if not batch:
+                    break
+                self._deliver(batch)
+                self.delivered += len(batch)
+
+            if self._stop_event.is_set():
+                break
+
+    def _deliver(self, batch):
+        # while the server is known to be down, do not wait for timeouts on every batch
+        if time.monotonic() < self._next_retry:
+            self._spool(batch)
+            return
+        try:
+            self._send(batch)
+        except Exception as e:
+            logger.error(f"While writing to InfluxDB: {e}. Will retry in {self.retry_interval} s.")
+            self._next_retry = time.monotonic() + self.retry_interval
+            self._spool(batch)
+            return
+
+        if self.spool is not None and len(self.spool):
+            try:
+                self.spool.drain(self._send)
+            except Exception as e:
+                logger.error(f"While draining spool: {e}. Will retry later.")
+                self._next_retry = time.monotonic() + self.retry_interval
+
+    def _spool(self, batch):
+        if self.spool is None:
+            logger.warning(f"No spool configured, {len(batch)} lines lost.")
+            return
+        self.spool.append(batch)
@@ -1,55 +1,110 @@
 """
 Daedalus project Lakeshore class
 
+Keeps one connection open, reads line framed responses and reconnects
+with exponential backoff. Several sensors can be queried in one round
+trip, e.g. "KRDG?A;KRDG?B" or "KRDG? 0".
+
 May 2025 xaratustrah@github
 
 """
 
 import socket
-import re
 import time
+from loguru import logger
+
 
 class Lakeshore:
-    def __init__(self, host, port, timeout=1):
+    def __init__(self, host, port, timeout=1, min_backoff=0.5, max_backoff=30):
         self.host = host
         self.port = port
         self.timeout = timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
         self.sock = None
+        self.reconnects = 0
+        self._connected_once = False
+
+        self._backoff = min_backoff
+        self._next_attempt = 0
+        self._buffer = bytearray()
+        self._chunk = bytearray(1024)
 
     def connect(self):
-        if self.sock is None:
-            try:
-                self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self.sock.settimeout(self.timeout)
-                self.sock.connect((self.host, self.port))
-            except socket.error as e:
-                logger.error(f"Connection error: {e}")
-                self.sock = None
+        if self.sock is not None:
+            return
+        if time.monotonic() < self._next_attempt:
+            raise ConnectionError(f"Lakeshore {self.host}:{self.port} unreachable, waiting for reconnect")
+        try:
+            self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError as e:
+            self._schedule_reconnect()
+            logger.error(f"Connection error: {e}")
+            raise
+        self._buffer.clear()
+        self._backoff = self.min_backoff
+        if self._connected_once:
+            self.reconnects += 1
+        self._connected_once = True
 
-    def get_temperature(self, message):
-        message = message if message.endswith("\n") else message + "\n" # Ensure newline for proper request termination
+    def _schedule_reconnect(self):
+        self.close()
+        self._next_attempt = time.monotonic() + self._backoff
+        self._backoff = min(self._backoff * 2, self.max_backoff)
 
-        if not self.sock:
-            self.connect()
+    def _readline(self):
+        """Reads one line terminated by \\n, keeping any extra bytes for the next call."""
+        view = memoryview(self._chunk)
+        while True:
+            end = self._buffer.find(b"\n")
+            if end >= 0:
+                line = bytes(self._buffer[:end])
+                del self._buffer[:end + 1]
+                return line.decode().strip()
+            n = self.sock.recv_into(view)
+            if n == 0:
+                raise ConnectionError("Connection closed by Lakeshore")
+            self._buffer += view[:n]
 
-        temp = 0
+    def query(self, message):
+        """Sends one (possibly compound) query and returns the response line."""
+        message = message if message.endswith("\n") else message + "\n" # Ensure newline for proper request termination
+
+        self.connect()
         try:
             self.sock.sendall(message.encode())
-            response = self.sock.recv(1024).decode()
-
+            response = self._readline()
             if not response:
                 raise ValueError("No incoming data")
+        except (OSError, ValueError):
+            # do not reuse a socket that may be out of sync
+            self._schedule_reconnect()
+            raise
+        return response
+
+    @staticmethod
+    def parse_temperatures(response):
+        return [float(value) for value in response.replace(",", ";").split(";")]
 
-            temp = float(re.sub(r'[^0-9.]', '', response))
-            #time.sleep(1)  # Simulate nc -q 1 behavior
+    def get_temperature(self, message):
+        return self.parse_temperatures(self.query(message))[0]
+
+    def get_temperatures(self, messages):
+        """Queries all sensors in one round trip.
 
-        except (socket.timeout, socket.error, ValueError) as e:
-            raise # rethrow the exception
-            
-        return temp
+        messages is either a list of queries like ["KRDG?A", "KRDG?B"] which are
+        pipelined as "KRDG?A;KRDG?B", or a single query like "KRDG? 0" which
+        returns all inputs at once.
+        """
+        if isinstance(messages, str):
+            return self.parse_temperatures(self.query(messages))
+        temperatures = self.parse_temperatures(self.query(";".join(messages)))
+        if len(temperatures) != len(messages):
+            raise ValueError(f"Expected {len(messages)} values, got {len(temperatures)}")
+        return temperatures
 
     def close(self):
         if self.sock:
             self.sock.close()
             self.sock = None
-
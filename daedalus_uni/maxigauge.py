@@ -0,0 +1,100 @@
+"""
+Daedalus project Maxigauge reader
+
+A background thread holds one connection to the Maxigauge bridge and
+parses the \\r\\n delimited records as they arrive. Each record has 12
+comma separated fields, status and value for each of the six gauges.
+Samples are kept in a timestamped ring buffer, so reading the latest
+values never touches the network.
+
+2025 xaratustrah@github
+
+"""
+
+import collections
+import socket
+import threading
+import time
+from loguru import logger
+
+NUM_GAUGES = 6
+
+
+def parse_record(line):
+    """Returns the six gauge values of a record or None if the record is incomplete."""
+    lst = line.split(",")
+    if len(lst) != 2 * NUM_GAUGES:
+        return None
+    return tuple(float(lst[i]) for i in range(1, len(lst), 2))
+
+
+class Maxigauge:
+    def __init__(self, host, port, timeout=2, history=600, min_backoff=0.5, max_backoff=30):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.reconnects = 0
+
+        # ring buffer of (epoch time, values)
+        self.samples = collections.deque(maxlen=history)
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="maxigauge")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=2):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def latest(self):
+        """Returns (epoch time, values) of the newest sample or None."""
+        try:
+            return self.samples[-1]
+        except IndexError:
+            return None
+
+    def get_pressures(self, default=(0.0,) * NUM_GAUGES):
+        sample = self.latest()
+        return default if sample is None else sample[1]
+
+    def feed(self, buffer, data):
+        """Appends data to buffer and stores every complete record. Returns the incomplete rest."""
+        buffer += data
+        *lines, rest = buffer.split("\r\n")
+        for line in lines:
+            try:
+                values = parse_record(line)
+            except ValueError:
+                logger.warning(f"Malformed Maxigauge record: {line!r}")
+                continue
+            if values is not None:
+                self.samples.append((time.time(), values))
+        # never let garbage without line breaks grow the buffer
+        return rest if len(rest) <= 4096 else ""
+
+    def _run(self):
+        backoff = self.min_backoff
+        connected_once = False
+        while not self._stop_event.is_set():
+            try:
+                with socket.create_connection((self.host, self.port), timeout=self.timeout) as s:
+                    if connected_once:
+                        self.reconnects += 1
+                    connected_once = True
+                    backoff = self.min_backoff
+                    buffer = ""
+                    while not self._stop_event.is_set():
+                        data = s.recv(1024)
+                        if not data:
+                            raise ConnectionError("Connection closed by Maxigauge bridge")
+                        buffer = self.feed(buffer, data.decode(errors="replace"))
+            except OSError as e:
+                logger.error(f"While reading pressures: {e}. Reconnecting in {backoff} s.")
+                self._stop_event.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
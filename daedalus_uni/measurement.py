@@ -0,0 +1,105 @@
+"""
+Daedalus project measurement records and line protocol encoder
+
+A Point is created once per channel and reused every cycle. Its static
+tags are escaped once at construction, so encoding a cycle only renders
+the values and the timestamp.
+
+2025 xaratustrah@github
+
+"""
+
+import io
+import math
+
+# timestamps are kept in ns and divided down to the write precision
+PRECISION_DIVISORS = {"ns": 1, "us": 1000, "ms": 1000000, "s": 1000000000}
+
+MEASUREMENT_ESCAPES = str.maketrans({",": r"\,", " ": r"\ "})
+KEY_ESCAPES = str.maketrans({",": r"\,", "=": r"\=", " ": r"\ "})
+STRING_ESCAPES = str.maketrans({'"': r'\"', "\\": r"\\"})
+
+
+def escape_measurement(name):
+    return str(name).translate(MEASUREMENT_ESCAPES)
+
+
+def escape_key(key):
+    """Escapes tag keys, tag values and field keys."""
+    return str(key).translate(KEY_ESCAPES)
+
+
+def format_field(value):
+    """Renders a field value, returns None for values InfluxDB cannot store (NaN, inf, None)."""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, str):
+        return '"' + value.translate(STRING_ESCAPES) + '"'
+    if value is None:
+        return None
+    # integers are written as floats, so the types of existing fields do not change
+    value = float(value)
+    if not math.isfinite(value):
+        return None
+    return repr(value)
+
+
+class Point:
+    """One InfluxDB point. Static tags never change, dynamic tags and fields are set every cycle."""
+
+    __slots__ = ("measurement", "static_tags", "tags", "fields", "time", "prefix")
+
+    def __init__(self, measurement, static_tags):
+        self.measurement = measurement
+        self.static_tags = dict(static_tags)
+        self.tags = {}
+        self.fields = {}
+        self.time = 0 # epoch time in ns
+        self.prefix = escape_measurement(measurement) + "".join(
+            f",{escape_key(k)}={escape_key(v)}" for k, v in self.static_tags.items()
+        )
+
+    def set(self, value, timestamp):
+        self.fields["value"] = value
+        self.time = timestamp
+        return self
+
+    def to_dict(self):
+        """Flat dictionary in the format of the JSON log."""
+        return {"name": self.measurement, **self.static_tags, **self.tags, **self.fields,
+                "epoch_time": self.time / 1e9}
+
+
+class LineProtocolEncoder:
+    def __init__(self, precision="s"):
+        self.precision = precision
+        self.divisor = PRECISION_DIVISORS[precision]
+        self._buffer = io.StringIO()
+
+    def encode_point(self, point, out):
+        fields = []
+        for key, value in point.fields.items():
+            rendered = format_field(value)
+            if rendered is not None:
+                fields.append(f"{escape_key(key)}={rendered}")
+        if not fields:
+            return False
+
+        out.write(point.prefix)
+        for key, value in point.tags.items():
+            if value == "" or value is None:
+                continue
+            out.write(f",{escape_key(key)}={escape_key(value)}")
+        out.write(" ")
+        out.write(",".join(fields))
+        out.write(f" {point.time // self.divisor}\n")
+        return True
+
+    def encode(self, points):
+        """Returns the line protocol of all points, one per line. Points without valid fields are skipped."""
+        out = self._buffer
+        out.seek(0)
+        out.truncate()
+        for point in points:
+            self.encode_point(point, out)
+        return out.getvalue().rstrip("\n")
@@ -0,0 +1,180 @@
+"""
+Daedalus project self instrumentation
+
+Per stage timing histograms, error and timeout counters and gauges
+(reconnects, staleness). They are emitted periodically as the
+daedalus_internal measurement. A cProfile or pyinstrument profiler can
+be toggled at runtime with SIGUSR1.
+
+2025 xaratustrah@github
+
+"""
+
+import bisect
+import contextlib
+import signal
+import threading
+import time
+from loguru import logger
+
+from .measurement import Point
+
+MEASUREMENT = "daedalus_internal"
+
+# upper bucket bounds in seconds, 100 us to 30 s, roughly 4 per decade
+BUCKETS = [
+    0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05,
+    0.1, 0.2, 0.5, 1, 2, 5, 10, 30, float("inf"),
+]
+
+
+class Histogram:
+    """Fixed bucket histogram, recording is O(1) and allocation free."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """Upper bound of the bucket containing the q quantile, capped at the observed maximum."""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    @contextlib.contextmanager
+    def timer(self, stage):
+        """Times the block as the given stage and counts errors and timeouts raised inside it."""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.error(stage, e)
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def error(self, stage, exception=None):
+        kind = "timeouts" if isinstance(exception, TimeoutError) else "errors"
+        self.increment(stage, kind)
+
+    def increment(self, stage, name, amount=1):
+        with self._lock:
+            key = (stage, name)
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set_gauge(self, source, name, value):
+        with self._lock:
+            self.gauges[(source, name)] = value
+
+    def points(self, timestamp):
+        """Returns one point per stage or source and resets the histograms for the next interval.
+
+        Counters are cumulative, like the reconnect counts of the devices.
+        """
+        fields = {}
+        with self._lock:
+            for stage, histogram in self.histograms.items():
+                f = fields.setdefault(stage, {})
+                f["count"] = histogram.count
+                f["mean"] = histogram.sum / histogram.count if histogram.count else 0.0
+                f["p50"] = histogram.quantile(0.5)
+                f["p95"] = histogram.quantile(0.95)
+                f["p99"] = histogram.quantile(0.99)
+                f["max"] = histogram.max
+                histogram.reset()
+            for (stage, name), value in self.counters.items():
+                fields.setdefault(stage, {})[name] = value
+            for (source, name), value in self.gauges.items():
+                fields.setdefault(source, {})[name] = value
+
+        points = []
+        for stage, f in fields.items():
+            point = Point(MEASUREMENT, {"stage": stage})
+            point.fields.update(f)
+            point.time = timestamp
+            points.append(point)
+        return points
+
+
+class Profiler:
+    """Runtime toggled profiler for the main thread. Each SIGUSR1 starts or stops it,
+    on stop the statistics are written to a file and logged."""
+
+    def __init__(self, kind="cprofile", output_prefix="daedalus_profile"):
+        self.kind = kind
+        self.output_prefix = output_prefix
+        self._profiler = None
+
+    def install(self):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: self.toggle())
+        logger.info(f"Send SIGUSR1 to toggle the {self.kind} profiler")
+
+    @property
+    def running(self):
+        return self._profiler is not None
+
+    def toggle(self):
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+
+    def start(self):
+        if self.kind == "pyinstrument":
+            from pyinstrument import Profiler as PyinstrumentProfiler
+            self._profiler = PyinstrumentProfiler()
+            self._profiler.start()
+        else:
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        logger.info("Profiler started")
+
+    def stop(self):
+        profiler, self._profiler = self._profiler, None
+        name = f"{self.output_prefix}_{time.strftime('%Y%m%d_%H%M%S')}"
+        if self.kind == "pyinstrument":
+            profiler.stop()
+            name += ".html"
+            with open(name, "w") as f:
+                f.write(profiler.output_html())
+        else:
+            import pstats
+            profiler.disable()
+            name += ".prof"
+            profiler.dump_stats(name)
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(15)
+        logger.info(f"Profiler stopped, results in {name}")
@@ -0,0 +1,187 @@
+"""
+Daedalus project ZeroMQ fan-out
+
+Every measurement and edge event is published on a ZeroMQ PUB socket, so
+live consumers get updates within milliseconds without querying
+InfluxDB. The topic is dev/measurement followed by the remaining static
+tag values, e.g. GJ_S1/vacuum/4 or nozzle/shutter/0/signal. Subscribers
+filter by prefix, e.g. "nozzle/" or "GJ_S1/". The payload is a compact struct
+encoding of the point:
+
+    int64 time in ns, uint8 number of fields, uint8 number of tags,
+    then per value: uint8 key length, key, type code, value
+
+with type codes d (float64), ? (bool) and s (uint16 length + utf-8).
+
+    from daedalus_uni.pubsub import Subscriber
+    sub = Subscriber("tcp://daedalus-pi:5560", topics=["nozzle/"]).start()
+    sub.get("nozzle/shutter/0/signal")
+
+2025 xaratustrah@github
+
+"""
+
+import struct
+import threading
+from loguru import logger
+
+HEADER = struct.Struct("<qBB")
+DOUBLE = struct.Struct("<d")
+LENGTH = struct.Struct("<H")
+
+
+def topic_of(point):
+    """dev/measurement followed by the other static tag values, the logging device is left out."""
+    tags = point.static_tags
+    parts = [str(tags.get("dev", "")), point.measurement]
+    parts += [str(v) for k, v in tags.items() if k not in ("dev", "ldev")]
+    return "/".join(parts).encode()
+
+
+def pack_values(values, out):
+    count = 0
+    for key, value in values.items():
+        if value is None:
+            continue
+        key = str(key).encode()
+        out += bytes((len(key),)) + key
+        if isinstance(value, bool):
+            out += b"?" + (b"\x01" if value else b"\x00")
+        elif isinstance(value, str):
+            text = value.encode()
+            out += b"s" + LENGTH.pack(len(text)) + text
+        else:
+            out += b"d" + DOUBLE.pack(float(value))
+        count += 1
+    return count
+
+
+def encode(point):
+    """Returns the payload of a point, dynamic tags are included."""
+    body = bytearray()
+    fields = pack_values(point.fields, body)
+    tags = pack_values(point.tags, body)
+    return HEADER.pack(point.time, fields, tags) + body
+
+
+def unpack_values(payload, offset, count):
+    values = {}
+    for _ in range(count):
+        length = payload[offset]
+        key = payload[offset + 1:offset + 1 + length].decode()
+        offset += 1 + length
+        kind = payload[offset:offset + 1]
+        offset += 1
+        if kind == b"?":
+            values[key] = payload[offset] != 0
+            offset += 1
+        elif kind == b"s":
+            (length,) = LENGTH.unpack_from(payload, offset)
+            values[key] = payload[offset + 2:offset + 2 + length].decode()
+            offset += 2 + length
+        else:
+            (values[key],) = DOUBLE.unpack_from(payload, offset)
+            offset += 8
+    return values, offset
+
+
+def decode(payload):
+    """Returns (time in ns, fields, tags) of a payload."""
+    timestamp, field_count, tag_count = HEADER.unpack_from(payload)
+    fields, offset = unpack_values(payload, HEADER.size, field_count)
+    tags, _ = unpack_values(payload, offset, tag_count)
+    return timestamp, fields, tags
+
+
+class Publisher:
+    def __init__(self, address="tcp://*:5560", hwm=1000):
+        import zmq
+        self._zmq = zmq
+        self.address = address
+        self.socket = zmq.Context.instance().socket(zmq.PUB)
+        # slow subscribers drop messages instead of growing the queue
+        self.socket.setsockopt(zmq.SNDHWM, hwm)
+        self.socket.setsockopt(zmq.LINGER, 0)
+        self.socket.bind(address)
+        self.dropped = 0
+        self._topics = {}
+        # the socket is shared by the publish loop and the edge dispatch thread
+        self._lock = threading.Lock()
+        logger.info(f"Publishing measurements on {address}")
+
+    def publish(self, points):
+        with self._lock:
+            for point in points:
+                if not point.fields:
+                    continue
+                topic = self._topics.get(point.prefix)
+                if topic is None:
+                    topic = self._topics[point.prefix] = topic_of(point)
+                try:
+                    self.socket.send_multipart([topic, encode(point)], flags=self._zmq.NOBLOCK)
+                except self._zmq.Again:
+                    self.dropped += 1
+
+    def close(self):
+        with self._lock:
+            self.socket.close()
+
+
+class Subscriber:
+    """Keeps the latest value of every subscribed topic, optionally calls func(topic, time, fields, tags)."""
+
+    def __init__(self, address, topics=("",), func=None):
+        import zmq
+        self._zmq = zmq
+        self.address = address
+        self.topics = topics
+        self.func = func
+        self._lock = threading.Lock()
+        self._latest = {}
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="zmq-subscriber")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=2):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def get(self, topic, default=None):
+        """Returns (time in ns, fields, tags) of a topic."""
+        with self._lock:
+            return self._latest.get(topic, default)
+
+    def latest(self):
+        with self._lock:
+            return dict(self._latest)
+
+    def _run(self):
+        zmq = self._zmq
+        socket = zmq.Context.instance().socket(zmq.SUB)
+        socket.setsockopt(zmq.LINGER, 0)
+        for topic in self.topics:
+            socket.setsockopt(zmq.SUBSCRIBE, topic.encode())
+        socket.connect(self.address)
+        try:
+            while not self._stop_event.is_set():
+                if not socket.poll(100):
+                    continue
+                topic, payload = socket.recv_multipart()
+                topic = topic.decode()
+                try:
+                    value = decode(payload)
+                except (struct.error, IndexError, UnicodeDecodeError) as e:
+                    logger.warning(f"Undecodable message on {topic}: {e}")
+                    continue
+                with self._lock:
+                    self._latest[topic] = value
+                if self.func is not None:
+                    self.func(topic, *value)
+        finally:
+            socket.close()
@@ -0,0 +1,302 @@
+"""
+Daedalus project replay
+
+Backfills InfluxDB from the local records written with --log, e.g. after
+InfluxDB was down during a run. Both the archive directory and the older
+JSON lines log files are read as a stream, encoded with the same line
+protocol encoder as the live path and written with their original
+timestamps in large gzip compressed batches by several parallel writers.
+
+Progress is saved to a checkpoint file whenever all batches up to a
+position have been written, so an interrupted replay resumes there.
+
+    python -m daedalus_uni.replay --cfg cfg.toml data/archive
+    python -m daedalus_uni.replay --cfg cfg.toml old_run.log --start 2025-03-01T12:00
+
+2025 xaratustrah@github
+
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import toml
+from loguru import logger
+
+from .archive import ArchiveReader, INDEX_FILE
+from .measurement import Point, LineProtocolEncoder
+
+
+def parse_value(value):
+    """Splits the old density value string '1.2e12,species="H2"' into the value and extra fields."""
+    extra = {}
+    if not isinstance(value, str):
+        return value, extra
+    value, *pairs = value.split(",")
+    for pair in pairs:
+        key, _, text = pair.partition("=")
+        extra[key.strip()] = text.strip().strip('"')
+    try:
+        value = float(value)
+    except ValueError:
+        pass
+    return value, extra
+
+
+def point_from_dict(entry):
+    """Converts one entry of the JSON log. Keys before value are tags, value and the keys after it are fields."""
+    point = Point(entry.get("name", ""), {})
+    target = point.tags
+    for key, value in entry.items():
+        if key == "name":
+            continue
+        if key == "epoch_time":
+            point.time = int(value * 1e9)
+            continue
+        if key == "value":
+            target = point.fields
+            value, extra = parse_value(value)
+            target[key] = value
+            target.update(extra)
+            continue
+        target[key] = value
+    return point
+
+
+def time_ns(text):
+    """Epoch time in ns from an ISO date or epoch seconds, None stays None."""
+    if text is None:
+        return None
+    try:
+        return int(float(text) * 1e9)
+    except ValueError:
+        return int(datetime.fromisoformat(text).timestamp() * 1e9)
+
+
+def read_archive(path, start=None, end=None, position=None):
+    """Yields (position, points) per row. The position is the row time in ns."""
+    if position is not None:
+        start = position + 1 if start is None else max(start, position + 1)
+    reader = ArchiveReader(path)
+    for entry in reader.segments(start, end):
+        for row_time, points in reader.segment_points(entry, start, end):
+            yield row_time, points
+
+
+def read_log(path, start=None, end=None, position=None):
+    """Yields (position, points) per line of a JSON log. The position is the byte offset after the line."""
+    offset = position or 0
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            offset += len(line)
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                logger.warning(f"Skipping unreadable line at byte {offset - len(line)}")
+                continue
+            points = []
+            for value in entry.values():
+                point = point_from_dict(value)
+                if point.time == 0:
+                    continue
+                if (start is None or point.time >= start) and (end is None or point.time <= end):
+                    points.append(point)
+            yield offset, points
+
+
+def open_source(path):
+    if os.path.isdir(path):
+        if not os.path.exists(os.path.join(path, INDEX_FILE)):
+            raise FileNotFoundError(f"No archive index in {path}")
+        return "archive", read_archive
+    return "log", read_log
+
+
+class Checkpoint:
+    """Keeps the position up to which all batches have been written. Batches may finish out of order."""
+
+    def __init__(self, filename, source, kind):
+        self.filename = filename
+        self.source = os.path.abspath(source)
+        self.kind = kind
+        self.position = None
+        self._lock = threading.Lock()
+        self._done = {}
+        self._next = 0
+
+        if filename and os.path.exists(filename):
+            with open(filename) as f:
+                saved = json.load(f)
+            if saved.get("source") == self.source and saved.get("kind") == kind:
+                self.position = saved["position"]
+                logger.info(f"Resuming {self.source} from {kind} position {self.position}")
+            else:
+                logger.warning(f"Checkpoint {filename} belongs to {saved.get('source')}, starting from the beginning")
+
+    def done(self, sequence, position):
+        with self._lock:
+            self._done[sequence] = position
+            advanced = False
+            while self._next in self._done:
+                self.position = self._done.pop(self._next)
+                self._next += 1
+                advanced = True
+            if advanced:
+                self.save()
+
+    def save(self):
+        if not self.filename:
+            return
+        with open(self.filename + ".tmp", "w") as f:
+            json.dump({"source": self.source, "kind": self.kind, "position": self.position}, f)
+        os.replace(self.filename + ".tmp", self.filename)
+
+
+class Replayer:
+    def __init__(self, write_api, bucket, org, precision="ms", batch_size=10000,
+                 workers=4, retries=5, retry_interval=2):
+        self.write_api = write_api
+        self.bucket = bucket
+        self.org = org
+        self.precision = precision
+        self.batch_size = batch_size
+        self.retries = retries
+        self.retry_interval = retry_interval
+        self.encoder = LineProtocolEncoder(precision=precision)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="replay")
+        # at most two batches per worker wait in memory
+        self._slots = threading.BoundedSemaphore(2 * workers)
+        self._failed = None
+        self.lines = 0
+        self.records = 0
+
+    def _write(self, sequence, position, record, checkpoint):
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    if self.write_api is not None:
+                        self.write_api.write(bucket=self.bucket, org=self.org, record=record,
+                                             write_precision=self.precision)
+                    break
+                except Exception as e:
+                    if attempt == self.retries:
+                        raise
+                    logger.warning(f"While writing batch {sequence}: {e}. Retrying...")
+                    time.sleep(self.retry_interval * 2 ** attempt)
+            checkpoint.done(sequence, position)
+        except Exception as e:
+            self._failed = e
+        finally:
+            self._slots.release()
+
+    def _submit(self, sequence, position, chunks, checkpoint):
+        self._slots.acquire()
+        self.executor.submit(self._write, sequence, position, "\n".join(chunks), checkpoint)
+
+    def run(self, records, checkpoint):
+        """Encodes and writes all records. Returns False if a batch could not be written."""
+        chunks = []
+        lines = 0
+        sequence = 0
+        position = None
+        start = time.monotonic()
+        last_report = start
+
+        for position, points in records:
+            if self._failed is not None:
+                break
+            record = self.encoder.encode(points)
+            self.records += 1
+            if record:
+                chunks.append(record)
+                lines += record.count("\n") + 1
+            if lines >= self.batch_size:
+                self._submit(sequence, position, chunks, checkpoint)
+                sequence += 1
+                self.lines += lines
+                chunks = []
+                lines = 0
+
+            now = time.monotonic()
+            if now - last_report >= 10:
+                logger.info(f"{self.records} records, {self.lines} lines, "
+                            f"{self.lines / (now - start):.0f} lines/s")
+                last_report = now
+
+        if self._failed is None and position is not None:
+            # the last batch also carries the final position if it has no lines
+            if chunks:
+                self._submit(sequence, position, chunks, checkpoint)
+                self.lines += lines
+            else:
+                checkpoint.done(sequence, position)
+
+        self.executor.shutdown(wait=True)
+        elapsed = time.monotonic() - start
+        if self._failed is not None:
+            logger.error(f"Replay stopped: {self._failed}. Resume from position {checkpoint.position}.")
+            return False
+        logger.success(f"Replayed {self.records} records, {self.lines} lines in {elapsed:.1f} s "
+                       f"({self.lines / max(elapsed, 1e-9):.0f} lines/s)")
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay local Daedalus records into InfluxDB.")
+    parser.add_argument("source", type=str, help="Archive directory or JSON lines log file")
+    parser.add_argument("--cfg", type=str, required=True, help="Path to the TOML file with the InfluxDB settings")
+    parser.add_argument("--start", type=str, help="Start time, ISO format or epoch seconds")
+    parser.add_argument("--end", type=str, help="End time, ISO format or epoch seconds")
+    parser.add_argument("--bucket", type=str, help="Target bucket instead of the configured one")
+    parser.add_argument("--precision", type=str, help="Write precision instead of the configured one")
+    parser.add_argument("--batch-size", type=int, default=10000, help="Lines per request")
+    parser.add_argument("--workers", type=int, default=4, help="Parallel requests")
+    parser.add_argument("--checkpoint", type=str, help="Checkpoint file, default is <source>.replay.json")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint")
+    parser.add_argument("--dry-run", action="store_true", help="Read and encode only, do not write")
+    args = parser.parse_args()
+
+    config = toml.load(args.cfg)
+    influx = config["influx"]
+    bucket = args.bucket or influx["bucket"]
+    precision = args.precision or influx.get("write_precision", "ms")
+
+    kind, reader = open_source(args.source)
+    checkpoint_file = args.checkpoint or args.source.rstrip("/") + ".replay.json"
+    if args.restart and os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+    checkpoint = Checkpoint(None if args.dry_run else checkpoint_file, args.source, kind)
+    records = reader(args.source, time_ns(args.start), time_ns(args.end), checkpoint.position)
+
+    client = None
+    write_api = None
+    if not args.dry_run:
+        from influxdb_client import InfluxDBClient
+        from influxdb_client.client.write_api import SYNCHRONOUS
+        client = InfluxDBClient(url=f'{influx["address"]}:{influx["port"]}', token=influx["token"],
+                                org=influx["org"], timeout=60000, enable_gzip=True,
+                                connection_pool_maxsize=args.workers)
+        write_api = client.write_api(write_options=SYNCHRONOUS)
+
+    logger.info(f"Replaying {kind} {args.source} into bucket {bucket} with {args.workers} workers")
+    replayer = Replayer(write_api, bucket, influx["org"], precision=precision,
+                        batch_size=args.batch_size, workers=args.workers)
+    try:
+        ok = replayer.run(records, checkpoint)
+    except KeyboardInterrupt:
+        logger.warning(f"Interrupted, resume from position {checkpoint.position}")
+        ok = False
+    finally:
+        if client is not None:
+            client.close()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Daedalus project SSE client for the REST vacuum feeds
+
+One generic subscriber per URL. Reconnects with exponential backoff and
+resumes with Last-Event-ID. Only the fields that are needed are pulled
+out of each event, the full JSON decoder is used only as a fallback.
+Results go into a versioned snapshot store.
+
+2025 xaratustrah@github
+
+"""
+
+import collections
+import json
+import re
+import threading
+import time
+from loguru import logger
+
+# Immutable, so readers never need a lock. The store swaps whole snapshots.
+Snapshot = collections.namedtuple(
+    "Snapshot", ["version", "device_name", "value", "acq_time", "received_time"]
+)
+
+PRESSURE_RE = re.compile(rb'"pressure"\s*:\s*"?(-?[0-9.eE+-]+)')
+TIMESTAMP_RE = re.compile(rb'"timestampAcq"\s*:\s*"?([0-9.eE+]+)')
+DEVICE_NAME_RE = re.compile(rb'"deviceName"\s*:\s*"([^"]*)"')
+
+
+def decode_event(data):
+    """Returns (device name, pressure in mbar, acquisition epoch time) from an event payload in bytes."""
+    pressure = PRESSURE_RE.search(data)
+    timestamp = TIMESTAMP_RE.search(data)
+    device_name = DEVICE_NAME_RE.search(data)
+    if pressure and timestamp and device_name:
+        return (
+            device_name.group(1).decode(),
+            float(pressure.group(1)) / 100.0, # convert Pa to mbar
+            float(timestamp.group(1)) / 1e9,
+        )
+
+    # slow path, e.g. for escaped strings
+    js = json.loads(data)
+    return (
+        js['sourceInfo']['deviceName'],
+        float(js['data']['pressure']) / 100.0, # convert Pa to mbar
+        float(js['data']['timestampAcq']) / 1e9,
+    )
+
+
+class SnapshotStore:
+    """Latest snapshot per feed. Each key has exactly one writer, readers get immutable tuples."""
+
+    def __init__(self):
+        self._snapshots = {}
+
+    def publish(self, key, device_name, value, acq_time):
+        previous = self._snapshots.get(key)
+        version = 1 if previous is None else previous.version + 1
+        self._snapshots[key] = Snapshot(version, device_name, value, acq_time, time.time())
+
+    def get(self, key):
+        return self._snapshots.get(key)
+
+    def age(self, key, now=None):
+        """Seconds since acquisition of the latest value, None if nothing has been received yet."""
+        snapshot = self._snapshots.get(key)
+        if snapshot is None:
+            return None
+        return (time.time() if now is None else now) - snapshot.acq_time
+
+    def keys(self):
+        return list(self._snapshots)
+
+
+class SSESubscriber:
+    def __init__(self, key, url, store, timeout=(5, 30), min_backoff=1, max_backoff=60):
+        self.key = key
+        self.url = url
+        self.store = store
+        self.timeout = timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.last_event_id = None
+        self.reconnects = 0
+
+        self._session = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"sse-{self.key}")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self):
+        # requests is imported here, so that it does not delay the start of the acquisition
+        import requests
+        self._session = requests.Session()
+        backoff = self.min_backoff
+        while not self._stop_event.is_set():
+            try:
+                headers = {"Accept": "text/event-stream"}
+                if self.last_event_id is not None:
+                    headers["Last-Event-ID"] = self.last_event_id
+                with self._session.get(self.url, stream=True, headers=headers, timeout=self.timeout) as r:
+                    r.raise_for_status()
+                    backoff = self.min_backoff
+                    self._consume(r.iter_lines())
+                raise ConnectionError("Stream ended")
+            except Exception as e:
+                if self._stop_event.is_set():
+                    break
+                logger.error(f"While reading {self.url}: {e}. Reconnecting in {backoff} s.")
+                self.reconnects += 1
+                self._stop_event.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+    def _consume(self, lines):
+        data = []
+        for line in lines:
+            if self._stop_event.is_set():
+                return
+            if not line:
+                # blank line dispatches the event
+                if data:
+                    self._dispatch(b"\n".join(data))
+                    data = []
+                continue
+            field, _, value = line.partition(b":")
+            if value.startswith(b" "):
+                value = value[1:]
+            if field == b"data":
+                data.append(value)
+                # some servers never send the blank line, dispatch complete objects right away
+                if len(data) == 1 and value.startswith(b"{") and value.endswith(b"}"):
+                    self._dispatch(value)
+                    data = []
+            elif field == b"id":
+                self.last_event_id = value.decode()
+            elif field == b"retry" and value.isdigit():
+                self.min_backoff = int(value) / 1000
+        if data:
+            self._dispatch(b"\n".join(data))
+
+    def _dispatch(self, data):
+        try:
+            device_name, value, acq_time = decode_event(data)
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring malformed event from {self.url}: {e}")
+            return
+        self.store.publish(self.key, device_name, value, acq_time)
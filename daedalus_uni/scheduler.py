@@ -0,0 +1,197 @@
+"""
+Daedalus project acquisition scheduler
+
+Every data source runs in its own thread with its own poll period and
+writes into a shared latest-value store. The publish stage only reads
+from the store, so a slow device never delays the others.
+
+A source that fails or takes longer than its budget several times in a
+row trips its circuit breaker. It is then skipped and only probed again
+after a backoff, which doubles with every failed probe.
+
+2025 xaratustrah@github
+
+"""
+
+import contextlib
+import threading
+import time
+from loguru import logger
+
+
+class LatestValueStore:
+    """Thread-safe store holding the latest value of every source together with its update time."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def update(self, name, value, timestamp=None):
+        with self._lock:
+            self._values[name] = (value, time.time() if timestamp is None else timestamp)
+
+    def get(self, name, default=None):
+        with self._lock:
+            entry = self._values.get(name)
+        return default if entry is None else entry[0]
+
+    def timestamp(self, name):
+        with self._lock:
+            entry = self._values.get(name)
+        return None if entry is None else entry[1]
+
+    def snapshot(self):
+        """Returns a shallow copy of all entries as {name: (value, timestamp)}."""
+        with self._lock:
+            return dict(self._values)
+
+
+class CircuitBreaker:
+    """Counts the failures of a source in a row and decides when to call it again."""
+
+    def __init__(self, name, failures=3, min_backoff=1, max_backoff=60, metrics=None):
+        self.name = name
+        self.failures = failures
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.metrics = metrics
+        self.open = False
+        self.consecutive = 0
+        self.trips = 0
+        self._backoff = min_backoff
+        self._next_probe = 0
+
+    def allow(self):
+        """True while closed, when open only once the next probe is due."""
+        return not self.open or time.monotonic() >= self._next_probe
+
+    def success(self):
+        if self.open:
+            logger.info(f"{self.name} responds again, closing its circuit breaker")
+        self.open = False
+        self.consecutive = 0
+        self._backoff = self.min_backoff
+
+    def failure(self):
+        self.consecutive += 1
+        if self.open:
+            # failed probe
+            self._backoff = min(self._backoff * 2, self.max_backoff)
+        elif self.consecutive >= self.failures:
+            self.open = True
+            self.trips += 1
+            if self.metrics:
+                self.metrics.increment(self.name, "trips")
+            logger.warning(f"{self.name} failed {self.consecutive} times in a row, "
+                           f"skipping it and probing with backoff from {self._backoff} s")
+        else:
+            return
+        self._next_probe = time.monotonic() + self._backoff
+
+
+class Source:
+    """A periodically polled data source. The return value of func is written into the store.
+
+    A poll taking longer than budget seconds counts as a failure of the breaker, its value is still kept.
+    """
+
+    def __init__(self, name, period, func, store, metrics=None, budget=None, breaker=None):
+        self.name = name
+        self.period = period
+        self.func = func
+        self.store = store
+        self.metrics = metrics
+        self.budget = budget
+        self.breaker = breaker
+        self.thread = None
+
+    def poll(self):
+        start = time.monotonic()
+        timer = self.metrics.timer(self.name) if self.metrics else contextlib.nullcontext()
+        try:
+            with timer:
+                value = self.func()
+            if value is not None:
+                self.store.update(self.name, value)
+        except Exception as e:
+            logger.error(f"While polling {self.name}: {e}. Keeping last value.")
+            failed = True
+        else:
+            elapsed = time.monotonic() - start
+            failed = self.budget is not None and elapsed > self.budget
+            if failed:
+                logger.warning(f"Polling {self.name} took {elapsed:.3f} s, over its budget of {self.budget} s")
+                if self.metrics:
+                    self.metrics.increment(self.name, "over_budget")
+        if self.breaker is not None:
+            if failed:
+                self.breaker.failure()
+            else:
+                self.breaker.success()
+
+    def run(self, stop_event):
+        while not stop_event.is_set():
+            start = time.monotonic()
+            if self.breaker is None or self.breaker.allow():
+                self.poll()
+            elapsed = time.monotonic() - start
+            stop_event.wait(max(0, self.period - elapsed))
+
+
+class Scheduler:
+    def __init__(self, store, metrics=None):
+        self.store = store
+        self.metrics = metrics
+        self.sources = []
+        self._stop_event = threading.Event()
+
+    def add(self, name, period, func, budget=None, breaker=None):
+        source = Source(name, period, func, self.store, self.metrics, budget, breaker)
+        self.sources.append(source)
+        return source
+
+    def start(self):
+        for source in self.sources:
+            source.thread = threading.Thread(
+                target=source.run, args=(self._stop_event,), name=f"poll-{source.name}"
+            )
+            source.thread.daemon = True
+            source.thread.start()
+            logger.info(f"Polling {source.name} every {source.period} s")
+
+    def stop(self, timeout=2):
+        self._stop_event.set()
+        for source in self.sources:
+            if source.thread is not None:
+                source.thread.join(timeout)
+
+
+class DeadlineTimer:
+    """Fixed period on the monotonic clock, the work done in between does not stretch it.
+
+    Deadlines that have already passed are skipped instead of being caught up
+    with a burst. Overruns and the wake-up jitter are reported to metrics.
+    """
+
+    def __init__(self, period, metrics=None, name="publish"):
+        self.period = period
+        self.metrics = metrics
+        self.name = name
+        self.overruns = 0
+        self.jitter = 0.0
+        self.next_deadline = time.monotonic() + period
+
+    def wait(self):
+        delay = self.next_deadline - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            self.overruns += 1
+            if self.metrics:
+                self.metrics.increment(self.name, "overruns")
+            self.next_deadline += (-delay // self.period) * self.period
+
+        self.jitter = time.monotonic() - self.next_deadline
+        if self.metrics:
+            self.metrics.observe(f"{self.name}_jitter", abs(self.jitter))
+        self.next_deadline += self.period
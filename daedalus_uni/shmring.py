@@ -0,0 +1,200 @@
+"""
+Daedalus project shared memory ring
+
+Fixed layout records in a ring buffer in shared memory, written by one
+process and read by any number of others without locks. Every slot starts
+with the sequence number of its record, the writer invalidates it before
+and sets it after copying the data, so a reader drops records that were
+overwritten while it copied them.
+
+The header holds the number of written records and one committed cursor
+per reader, so a restarted reader continues where its predecessor left.
+
+2025 xaratustrah@github
+
+"""
+
+import math
+import numpy as np
+from multiprocessing import shared_memory
+
+from .measurement import Point
+
+HEADER_SLOTS = 8 # int64, the write count and the cursors of up to 7 readers
+TEXT_SIZE = 32 # bytes per string value
+
+# NaN and -1 mark missing values
+COLUMN_TYPES = {"float": "<f8", "int": "<f8", "bool": "i1", "str": f"S{TEXT_SIZE}"}
+MISSING = {"float": math.nan, "int": math.nan, "bool": -1, "str": b""}
+
+
+class Ring:
+    """Single writer ring of records with the given numpy fields, a seq field is added in front."""
+
+    def __init__(self, fields, capacity, name=None, create=True):
+        self.fields = list(fields)
+        self.capacity = capacity
+        self.dtype = np.dtype([("seq", "<i8")] + self.fields)
+        size = HEADER_SLOTS * 8 + capacity * self.dtype.itemsize
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=size if create else 0)
+        self.name = self.shm.name
+        self.owner = create
+        self.header = np.ndarray(HEADER_SLOTS, dtype=np.int64, buffer=self.shm.buf)
+        self.slots = np.ndarray(capacity, dtype=self.dtype, buffer=self.shm.buf, offset=HEADER_SLOTS * 8)
+        if create:
+            self.header[:] = 0
+            self.slots["seq"] = -1
+
+    def __reduce__(self):
+        # a ring passed to another process attaches to the same memory
+        return (Ring, (self.fields, self.capacity, self.name, False))
+
+    def row(self):
+        """Returns an empty record to fill and append."""
+        return np.zeros((), dtype=self.dtype)
+
+    def count(self):
+        return int(self.header[0])
+
+    def append(self, row):
+        seq = int(self.header[0])
+        slot = self.slots[seq % self.capacity]
+        slot["seq"] = -1
+        row["seq"] = -1
+        self.slots[seq % self.capacity] = row
+        slot["seq"] = seq
+        self.header[0] = seq + 1
+        return seq
+
+    def read(self, cursor, max_rows=None):
+        """Returns (records, next cursor, lost) of the records from cursor on.
+
+        Records overwritten before they were read are counted as lost."""
+        count = int(self.header[0])
+        lost = 0
+        if count - cursor > self.capacity:
+            lost = count - self.capacity - cursor
+            cursor = count - self.capacity
+        end = count if max_rows is None else min(count, cursor + max_rows)
+        if end <= cursor:
+            return self.slots[:0].copy(), cursor, lost
+        expected = np.arange(cursor, end)
+        indices = expected % self.capacity
+        records = self.slots[indices]
+        # the writer may have reached a slot while it was copied
+        valid = (records["seq"] == expected) & (self.slots["seq"][indices] == expected)
+        if not valid.all():
+            lost += int((~valid).sum())
+            records = records[valid]
+        return records, end, lost
+
+    def latest(self):
+        """Returns a copy of the newest record, None if there is none."""
+        records, _, _ = self.read(max(self.count() - 1, 0))
+        return records[-1] if len(records) else None
+
+    def cursor(self, reader):
+        return int(self.header[1 + reader])
+
+    def commit(self, reader, cursor):
+        self.header[1 + reader] = cursor
+
+    def close(self):
+        # the views have to go before the memory can be closed
+        self.header = self.slots = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class RingReader:
+    """Reads a ring from the committed cursor of its reader on, or from the newest record with latest=True."""
+
+    def __init__(self, ring, reader, latest=False):
+        self.ring = ring
+        self.reader = reader
+        self.cursor = ring.count() if latest else ring.cursor(reader)
+        self.lost = 0
+
+    def read(self, max_rows=None):
+        records, self.cursor, lost = self.ring.read(self.cursor, max_rows)
+        self.lost += lost
+        return records
+
+    def commit(self, cursor=None):
+        self.ring.commit(self.reader, self.cursor if cursor is None else cursor)
+
+    def lag(self):
+        return self.ring.count() - self.ring.cursor(self.reader)
+
+
+class RecordLayout:
+    """Fixed record of one publish cycle with the fields and tags every point can have.
+
+    columns maps the point keys to ({field: type}, {tag: type}) with the
+    types float, int, bool and str. Columns are named like in the archive.
+    Missing values and numeric NaN read back as missing, except the value."""
+
+    def __init__(self, points, columns):
+        self.templates = {key: (point.measurement, point.static_tags) for key, point in points.items()}
+        self.columns = []
+        self.fields = [("time", "<i8")]
+        for key in points:
+            fields, tags = columns.get(key, ({"value": "float"}, {}))
+            self.fields.append((f"{key}.time", "<i8"))
+            field_columns = [(f"{key}.{name}", name, kind) for name, kind in fields.items()]
+            tag_columns = [(f"{key}.tag.{name}", name, kind) for name, kind in tags.items()]
+            self.fields += [(column, COLUMN_TYPES[kind]) for column, _, kind in field_columns + tag_columns]
+            self.columns.append((key, f"{key}.time", field_columns, tag_columns))
+
+    def create_points(self):
+        return {key: Point(measurement, static_tags) for key, (measurement, static_tags) in self.templates.items()}
+
+    def pack(self, row, timestamp, points):
+        """Fills a ring record with the points of one cycle, timestamp in ns."""
+        row["time"] = timestamp
+        for key, time_column, field_columns, tag_columns in self.columns:
+            point = points[key]
+            row[time_column] = point.time
+            for column, name, kind in field_columns:
+                row[column] = pack_value(point.fields.get(name), kind)
+            for column, name, kind in tag_columns:
+                row[column] = pack_value(point.tags.get(name), kind)
+        return row
+
+    def unpack(self, row, points):
+        """Sets the points from a ring record, returns its timestamp in ns."""
+        for key, time_column, field_columns, tag_columns in self.columns:
+            point = points[key]
+            point.time = int(row[time_column])
+            point.fields.clear()
+            point.tags.clear()
+            for column, name, kind in field_columns:
+                value = unpack_value(row[column], kind)
+                if value is not None or name == "value":
+                    point.fields[name] = value
+            for column, name, kind in tag_columns:
+                value = unpack_value(row[column], kind)
+                if value is not None:
+                    point.tags[name] = value
+        return int(row["time"])
+
+
+def pack_value(value, kind):
+    if value is None:
+        return MISSING[kind]
+    if kind == "str":
+        return str(value).encode()[:TEXT_SIZE]
+    if kind == "bool":
+        return int(bool(value))
+    return float(value)
+
+
+def unpack_value(value, kind):
+    if kind == "str":
+        return value.decode() if value else None
+    if kind == "bool":
+        return None if value < 0 else bool(value)
+    if math.isnan(value):
+        return None
+    return int(value) if kind == "int" else float(value)
@@ -0,0 +1,368 @@
+"""
+Daedalus project device simulators
+
+Local stand-ins for all devices, so the system can be run, profiled and
+load tested without a Raspberry Pi or the real instruments. Network
+devices are served on local sockets, GPIO and SPI are faked in process.
+Every simulator takes a Faults instance for latency, jitter and failure
+rate.
+
+2025 xaratustrah@github
+
+"""
+
+import gzip
+import http.server
+import json
+import math
+import random
+import socketserver
+import threading
+import time
+from loguru import logger
+
+
+class Faults:
+    def __init__(self, latency=0.0, jitter=0.0, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+
+    def delay(self):
+        delay = self.latency + self._random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def fail(self):
+        return self._random.random() < self.failure_rate
+
+
+def waveform(channel, t):
+    """Slow sine per channel with a little noise, in ADC codes."""
+    return int(2048 + 1000 * math.sin(0.1 * t + channel) + random.gauss(0, 5))
+
+
+# ---------- in process hardware
+
+class SimulatedGPIO:
+    """Subset of the RPi.GPIO module interface."""
+
+    BOARD = "BOARD"
+    BCM = "BCM"
+    IN = "IN"
+    OUT = "OUT"
+    RISING = "RISING"
+    FALLING = "FALLING"
+    BOTH = "BOTH"
+    PUD_UP = "PUD_UP"
+    PUD_DOWN = "PUD_DOWN"
+
+    def __init__(self, toggle_rate=0.0, faults=None):
+        self.toggle_rate = toggle_rate # random input changes per second and pin
+        self.faults = faults or Faults()
+        self.levels = {}
+        self.callbacks = {}
+        self._last_update = time.monotonic()
+        # reentrant, edge callbacks read the input while a random toggle holds the lock
+        self._lock = threading.RLock()
+
+    def setwarnings(self, flag):
+        pass
+
+    def setmode(self, mode):
+        pass
+
+    def setup(self, pin, direction, pull_up_down=None):
+        self.levels.setdefault(pin, False)
+
+    def _random_toggles(self):
+        now = time.monotonic()
+        elapsed = now - self._last_update
+        self._last_update = now
+        for pin in list(self.levels):
+            if random.random() < self.toggle_rate * elapsed:
+                self.set_input(pin, not self.levels[pin])
+
+    def input(self, pin):
+        self.faults.delay()
+        if self.faults.fail():
+            raise RuntimeError(f"Simulated failure reading pin {pin}")
+        with self._lock:
+            self._random_toggles()
+            return self.levels[pin]
+
+    def output(self, pin, level):
+        self.levels[pin] = bool(level)
+
+    def set_input(self, pin, level):
+        """Changes an input level and fires the edge callbacks like an interrupt would."""
+        previous = self.levels.get(pin, False)
+        self.levels[pin] = bool(level)
+        if previous != bool(level):
+            for callback in self.callbacks.get(pin, []):
+                callback(pin)
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        self.callbacks.setdefault(pin, [])
+        if callback is not None:
+            self.callbacks[pin].append(callback)
+
+    def remove_event_detect(self, pin):
+        self.callbacks.pop(pin, None)
+
+    def cleanup(self):
+        self.callbacks.clear()
+
+
+class SimulatedSpiDev:
+    """Subset of spidev.SpiDev that answers like an MCP3208, taking as long as the transfer at max_speed_hz."""
+
+    def __init__(self, faults=None):
+        self.faults = faults or Faults()
+        self.max_speed_hz = 0
+        self.start = time.monotonic()
+
+    def open(self, bus, cs):
+        self.bus = bus
+        self.cs = cs
+
+    def xfer2(self, data):
+        self.faults.delay()
+        if self.max_speed_hz:
+            time.sleep(len(data) * 8 / self.max_speed_hz)
+        if self.faults.fail():
+            raise OSError("Simulated SPI failure")
+        replies = []
+        t = time.monotonic() - self.start
+        for i in range(0, len(data) - 2, 3):
+            channel = ((data[i] & 0x01) << 2) | (data[i + 1] >> 6)
+            code = max(0, min(4095, waveform(channel, t)))
+            replies += [0, (code >> 8) & 0x0F, code & 0xFF]
+        return replies
+
+    xfer = xfer2
+
+    def close(self):
+        pass
+
+
+# ---------- network devices
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class _Server:
+    """Threaded TCP server on localhost, port 0 picks a free port."""
+
+    def __init__(self, handler, host="127.0.0.1", port=0):
+        self.server = _TCPServer((host, port), handler)
+        self.server.simulator = self
+        self.host, self.port = self.server.server_address
+
+    def start(self):
+        thread = threading.Thread(target=self.server.serve_forever, name=type(self).__name__)
+        thread.daemon = True
+        thread.start()
+        logger.info(f"{type(self).__name__} listening on {self.host}:{self.port}")
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _LakeshoreHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        sim = self.server.simulator
+        for line in self.rfile:
+            sim.faults.delay()
+            if sim.faults.fail():
+                return # drop the connection
+            queries = line.decode().strip().split(";")
+            values = []
+            for query in queries:
+                if query.replace(" ", "") == "KRDG?0":
+                    values += [f"{t:+08.3f}" for t in sim.temperatures()]
+                else:
+                    values.append(f"{sim.temperature(query[-1:]):+08.3f}")
+            sep = "," if len(queries) == 1 and len(values) > 1 else ";"
+            self.wfile.write((sep.join(values) + "\r\n").encode())
+
+
+class LakeshoreSimulator(_Server):
+    INPUTS = "ABCD"
+
+    def __init__(self, faults=None, **kwargs):
+        super().__init__(_LakeshoreHandler, **kwargs)
+        self.faults = faults or Faults()
+
+    def temperature(self, sensor):
+        index = self.INPUTS.find(sensor.upper())
+        return 40 + 5 * index + math.sin(time.time() / 60)
+
+    def temperatures(self):
+        return [self.temperature(s) for s in self.INPUTS]
+
+
+class _MaxigaugeHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        sim = self.server.simulator
+        while True:
+            sim.faults.delay()
+            if sim.faults.fail():
+                return
+            fields = []
+            for i in range(6):
+                fields += ["0", f"{1e-7 * (i + 1) * (1 + 0.1 * math.sin(time.time())):.4E}"]
+            record = ",".join(fields) + "\r\n"
+            try:
+                # split records on purpose, the reader must handle partial lines
+                cut = random.randrange(len(record))
+                self.request.sendall(record[:cut].encode())
+                self.request.sendall(record[cut:].encode())
+            except OSError:
+                return
+            time.sleep(sim.interval)
+
+
+class MaxigaugeSimulator(_Server):
+    def __init__(self, interval=0.5, faults=None, **kwargs):
+        super().__init__(_MaxigaugeHandler, **kwargs)
+        self.interval = interval
+        self.faults = faults or Faults()
+
+
+class _HTTPServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class _QuietHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class _SSEHandler(_QuietHandler):
+    def do_GET(self):
+        sim = self.server.simulator
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        event_id = int(self.headers.get("Last-Event-ID") or 0)
+        while True:
+            sim.faults.delay()
+            if sim.faults.fail():
+                return
+            event_id += 1
+            payload = {
+                "sourceInfo": {"deviceName": sim.device_name},
+                "data": {"pressure": 1e-8 * (1 + 0.1 * math.sin(time.time())), "timestampAcq": time.time_ns()},
+            }
+            try:
+                self.wfile.write(f"id: {event_id}\ndata: {json.dumps(payload)}\n\n".encode())
+                self.wfile.flush()
+            except OSError:
+                return
+            time.sleep(sim.interval)
+
+
+class SSESimulator:
+    def __init__(self, device_name="SIM_GAUGE", interval=0.5, faults=None, host="127.0.0.1", port=0):
+        self.device_name = device_name
+        self.interval = interval
+        self.faults = faults or Faults()
+        self.server = _HTTPServer((host, port), _SSEHandler)
+        self.server.simulator = self
+        self.host, self.port = self.server.server_address[:2]
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    start = _Server.start
+    stop = _Server.stop
+
+
+class _InfluxHandler(_QuietHandler):
+    def do_POST(self):
+        sim = self.server.simulator
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        sim.faults.delay()
+        if sim.faults.fail():
+            self.send_response(503)
+            self.end_headers()
+            return
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        lines = [line for line in body.decode().splitlines() if line]
+        with sim.lock:
+            sim.requests += 1
+            sim.lines += len(lines)
+            if sim.keep:
+                sim.received.extend(lines)
+        self.send_response(204)
+        self.end_headers()
+
+
+class InfluxSimulator:
+    """Accepts line protocol writes like the /api/v2/write endpoint and counts them."""
+
+    def __init__(self, faults=None, keep=False, host="127.0.0.1", port=0):
+        self.faults = faults or Faults()
+        self.keep = keep
+        self.requests = 0
+        self.lines = 0
+        self.received = []
+        self.lock = threading.Lock()
+        self.server = _HTTPServer((host, port), _InfluxHandler)
+        self.server.simulator = self
+        self.host, self.port = self.server.server_address[:2]
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    start = _Server.start
+    stop = _Server.stop
+
+
+def start_simulators(config):
+    """Starts simulators for all network devices and points the configuration at them.
+
+    Returns the list of started simulators.
+    """
+    sim_config = config.get("simulator", {})
+    faults = Faults(
+        latency=sim_config.get("latency", 0.0),
+        jitter=sim_config.get("jitter", 0.0),
+        failure_rate=sim_config.get("failure_rate", 0.0),
+    )
+    simulators = []
+
+    lakeshore = LakeshoreSimulator(faults=faults).start()
+    config["lakeshore"]["address"], config["lakeshore"]["port"] = lakeshore.host, lakeshore.port
+    simulators.append(lakeshore)
+
+    maxigauge = MaxigaugeSimulator(faults=faults).start()
+    config["maxigauge"]["address"], config["maxigauge"]["port"] = maxigauge.host, maxigauge.port
+    simulators.append(maxigauge)
+
+    restapi = config["restapi"]
+    if "feeds" in restapi:
+        for feed in restapi["feeds"].values():
+            sse = SSESimulator(device_name=feed["dev"], faults=faults).start()
+            feed["url"] = sse.url
+            simulators.append(sse)
+    else:
+        for key in ("resturl1", "resturl2"):
+            sse = SSESimulator(device_name=key.upper(), faults=faults).start()
+            restapi[key] = sse.url
+            simulators.append(sse)
+
+    influx = InfluxSimulator(faults=faults).start()
+    config["influx"]["address"], config["influx"]["port"] = f"http://{influx.host}", influx.port
+    simulators.append(influx)
+
+    return simulators
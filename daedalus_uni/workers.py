@@ -0,0 +1,359 @@
+"""
+Daedalus project worker processes
+
+In the multiprocess mode the acquisition process only reads the devices
+and appends one record per publish cycle to a shared memory ring, see
+shmring.py. The density calculation, the archive, InfluxDB and the live
+outputs (ZeroMQ, HTTP) run in worker processes reading from it, so their
+CPU time does not compete for the GIL of the sampling threads and a hang
+in one of them does not stop the acquisition. The density worker returns
+its results through a ring of its own.
+
+The supervisor runs in the acquisition process and restarts crashed
+workers. The archive and InfluxDB workers continue from the last record
+they committed, as long as it is still in the ring. They commit a record
+once it is on disk or was sent to InfluxDB or its spool.
+
+2025 xaratustrah@github
+
+"""
+
+import collections
+import queue
+import signal
+import threading
+import time
+import multiprocessing
+from loguru import logger
+
+from .shmring import RingReader
+
+POLL_INTERVAL = 0.01 # in seconds, how often idle workers look for new records
+
+# reader slots in the ring headers
+INFLUX, ARCHIVE, DENSITY, LIVE = range(4)
+
+EDGE_FIELDS = [("time", "<i8"), ("input", "u1"), ("level", "?")]
+DENSITY_FIELDS = [("time", "<i8"), ("value", "<f8")]
+
+
+class LineQueue:
+    """Hands line protocol to the InfluxDB worker, takes the place of the InfluxWriter in the acquisition."""
+
+    spool = None
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.dropped = 0
+
+    def write(self, record):
+        if not record:
+            return
+        try:
+            self.lines.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        pass
+
+    def close(self, timeout=None):
+        # queued lines are given up if the worker is gone
+        self.lines.cancel_join_thread()
+
+
+class DeliveredCommits:
+    """Commits the cursor of a reader once the InfluxWriter has delivered the lines written before it."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self._pending = collections.deque()
+
+    def mark(self):
+        self._pending.append((self.writer.written, self.reader.cursor))
+
+    def commit(self):
+        cursor = None
+        while self._pending and self.writer.delivered >= self._pending[0][0]:
+            _, cursor = self._pending.popleft()
+        if cursor is not None:
+            self.reader.commit(cursor)
+
+
+def density_worker(stop_event, records, densities, layout, species, settings, fixed_pressure=None, breaker=None):
+    """Computes the density of the newest record and appends it to the densities ring."""
+    from .density import DensityEngine
+    from .scheduler import CircuitBreaker
+    engine = DensityEngine(species, **settings)
+    breaker = CircuitBreaker("density", **(breaker or {}))
+    reader = RingReader(records, DENSITY, latest=True)
+    points = layout.create_points()
+    row = densities.row()
+
+    # the s4 feed may not be configured, 0.1 like a feed without data
+    if "s4" not in points:
+        logger.warning("No s4 feed, the density is calculated with S4 = 0.1")
+
+    def value(key, default=0):
+        point = points.get(key)
+        return default if point is None else point.fields.get("value") or default
+
+    while not stop_event.is_set():
+        rows = reader.read()
+        if not len(rows):
+            stop_event.wait(POLL_INTERVAL)
+            continue
+        if not breaker.allow():
+            continue
+        # only the newest record matters, the calculation may be slower than the cycle
+        layout.unpack(rows[-1], points)
+        pressure = value("nozzle_pressure") if fixed_pressure is None else fixed_pressure
+        try:
+            row["value"] = engine.get_density(T=value("temperature1"), p=pressure,
+                                              S1=value("s1"), S2=value("s2"), S3=value("s3"), S4=value("s4", 0.1))
+        except Exception as e:
+            logger.error(f"While calculating the density: {e}. Keeping last value.")
+            breaker.failure()
+            continue
+        breaker.success()
+        row["time"] = time.time_ns()
+        densities.append(row)
+
+
+def influx_worker(stop_event, records, edges, layout, edge_points, lines, settings, precision="ms", deadband=None,
+                  aggregate=None, downsampled=None, metrics_interval=10):
+    """Writes the records, the edge events and the queued line protocol to InfluxDB, the aggregates to their bucket.
+
+    The metrics of the writers and the deadband are written every metrics_interval seconds."""
+    from .influx_writer import InfluxWriter
+    from .measurement import LineProtocolEncoder
+    from .deadband import DeadbandFilter
+    from .aggregate import Aggregator
+    from .metrics import Metrics
+    metrics = Metrics()
+    writer = InfluxWriter(**settings, metrics=metrics)
+    deadband = DeadbandFilter(**deadband, metrics=metrics) if deadband is not None else None
+    aggregator = downsampled_writer = None
+    if aggregate is not None:
+        aggregator = Aggregator(**aggregate)
+        downsampled_writer = InfluxWriter(**downsampled, metrics=metrics)
+    next_metrics_time = time.monotonic() + metrics_interval
+    encoder = LineProtocolEncoder(precision=precision)
+    reader = RingReader(records, INFLUX)
+    edge_reader = RingReader(edges, INFLUX)
+    # a restarted worker writes again what was only queued in the writer
+    commits = DeliveredCommits(reader, writer)
+    edge_commits = DeliveredCommits(edge_reader, writer)
+    points = layout.create_points()
+    lost = 0
+    try:
+        while not stop_event.is_set():
+            rows = reader.read()
+            for row in rows:
+                timestamp = layout.unpack(row, points)
+                writer.write(encoder.encode(points.values() if deadband is None else deadband.filter(points.items())))
+                if aggregator is not None:
+                    downsampled_writer.write(encoder.encode(aggregator.add(timestamp, points.items())))
+            if len(rows):
+                commits.mark()
+            commits.commit()
+            edge_rows = edge_reader.read()
+            for row in edge_rows:
+                point = edge_points[row["input"]].set(bool(row["level"]), int(row["time"]))
+                writer.write(encoder.encode([point]))
+            if len(edge_rows):
+                writer.flush()
+                edge_commits.mark()
+            edge_commits.commit()
+            while True:
+                try:
+                    writer.write(lines.get_nowait())
+                except queue.Empty:
+                    break
+            if time.monotonic() >= next_metrics_time:
+                next_metrics_time += metrics_interval
+                writer.write(encoder.encode(metrics.points(time.time_ns())))
+            if reader.lost != lost:
+                logger.warning(f"InfluxDB worker lost {reader.lost - lost} records, the ring was overwritten")
+                lost = reader.lost
+            if not len(rows) and not len(edge_rows):
+                stop_event.wait(POLL_INTERVAL)
+    finally:
+        writer.close()
+        commits.commit()
+        edge_commits.commit()
+        if downsampled_writer is not None:
+            downsampled_writer.close()
+
+
+def archive_worker(stop_event, records, layout, settings):
+    """Appends the records to the archive, the cursor is committed with every written chunk or segment."""
+    from .archive import ArchiveWriter
+    archive = ArchiveWriter(**settings)
+    reader = RingReader(records, ARCHIVE)
+    points = layout.create_points()
+    try:
+        while not stop_event.is_set():
+            rows = reader.read()
+            if not len(rows):
+                stop_event.wait(POLL_INTERVAL)
+                continue
+            for row in rows:
+                flushed = archive.flushed
+                archive.append(layout.unpack(row, points), points.items())
+                # a restarted worker rewrites the rows that were only buffered
+                if archive.flushed != flushed:
+                    reader.commit(int(row["seq"]) + 1)
+    finally:
+        archive.close()
+        reader.commit()
+
+
+def live_worker(stop_event, records, edges, layout, edge_names, edge_points, zmq=None, http=None):
+    """Publishes the records and edge events over ZeroMQ and HTTP, a restarted worker starts with the newest."""
+    publisher = live_server = None
+    if zmq is not None:
+        from .pubsub import Publisher
+        publisher = Publisher(**zmq)
+    if http is not None:
+        from .httpserver import LiveServer
+        live_server = LiveServer(**http).start()
+    reader = RingReader(records, LIVE, latest=True)
+    edge_reader = RingReader(edges, LIVE, latest=True)
+    points = layout.create_points()
+    try:
+        while not stop_event.is_set():
+            rows = reader.read()
+            for row in rows:
+                layout.unpack(row, points)
+                if publisher is not None:
+                    publisher.publish(points.values())
+            if len(rows) and live_server is not None:
+                live_server.update(points.items())
+            edge_rows = edge_reader.read()
+            for row in edge_rows:
+                point = edge_points[row["input"]].set(bool(row["level"]), int(row["time"]))
+                if publisher is not None:
+                    publisher.publish([point])
+                if live_server is not None:
+                    live_server.event(edge_names[row["input"]], point)
+            if not len(rows) and not len(edge_rows):
+                stop_event.wait(POLL_INTERVAL)
+    finally:
+        if publisher is not None:
+            publisher.close()
+        if live_server is not None:
+            live_server.stop()
+
+
+class StopFlag:
+    """Shared stop flag, a multiprocessing.Event can block set() after a worker was killed while waiting on it."""
+
+    def __init__(self, context):
+        self._flag = context.RawValue("b", 0)
+
+    def set(self):
+        self._flag.value = 1
+
+    def is_set(self):
+        return bool(self._flag.value)
+
+    def wait(self, timeout):
+        time.sleep(timeout)
+        return self.is_set()
+
+
+def run_worker(target, stop_event, kwargs):
+    # Ctrl-C reaches the whole process group, workers stop on the event so they can flush
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    target(stop_event, **kwargs)
+
+
+class Worker:
+    def __init__(self, name, target, kwargs, delay):
+        self.name = name
+        self.target = target
+        self.kwargs = kwargs
+        self.delay = delay
+        self.process = None
+        self.started = None
+        self.restart_time = None
+        self.restarts = 0
+
+
+class Supervisor:
+    """Runs the worker processes and restarts them when they exit, with a growing delay if they keep crashing."""
+
+    def __init__(self, restart_delay=1, max_restart_delay=60, metrics=None):
+        # spawned, forking a process with running threads can copy held locks
+        self.context = multiprocessing.get_context("spawn")
+        self.stop_event = StopFlag(self.context)
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.metrics = metrics
+        self.workers = {}
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def queue(self, maxsize=1000):
+        return self.context.Queue(maxsize)
+
+    def add(self, name, target, **kwargs):
+        self.workers[name] = Worker(name, target, kwargs, self.restart_delay)
+
+    def start(self):
+        for worker in self.workers.values():
+            self._spawn(worker)
+        self._thread = threading.Thread(target=self._run, name="supervisor")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=10):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.stop_event.set()
+        deadline = time.monotonic() + timeout
+        for worker in self.workers.values():
+            worker.process.join(max(deadline - time.monotonic(), 0))
+            if worker.process.is_alive():
+                logger.warning(f"Worker {worker.name} did not stop, terminating it")
+                worker.process.terminate()
+                worker.process.join(1)
+
+    def alive(self, name):
+        process = self.workers[name].process
+        return process is not None and process.is_alive()
+
+    def _spawn(self, worker):
+        worker.process = self.context.Process(
+            target=run_worker,
+            args=(worker.target, self.stop_event, worker.kwargs),
+            name=f"daedalus-{worker.name}",
+            daemon=True,
+        )
+        worker.process.start()
+        worker.started = time.monotonic()
+        worker.restart_time = None
+
+    def _run(self):
+        while not self._stopped.wait(0.5):
+            now = time.monotonic()
+            for worker in self.workers.values():
+                if worker.process.is_alive():
+                    # running for a while, a later crash is restarted quickly again
+                    if now - worker.started > self.max_restart_delay:
+                        worker.delay = self.restart_delay
+                    continue
+                if worker.restart_time is None:
+                    logger.error(f"Worker {worker.name} exited with code {worker.process.exitcode}, "
+                                 f"restarting in {worker.delay} s")
+                    worker.restart_time = now + worker.delay
+                    worker.delay = min(worker.delay * 2, self.max_restart_delay)
+                elif now >= worker.restart_time and not self._stopped.is_set():
+                    self._spawn(worker)
+                    worker.restarts += 1
+                    if self.metrics is not None:
+                        self.metrics.increment(f"worker_{worker.name}", "restarts")